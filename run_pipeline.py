@@ -14,7 +14,8 @@ Usage:
                           [--use-msa] [--no-msa] [--use-msa-dir]
                           [--template TEMPLATE_FILE]
                           [--prediction-runs PRED_IDS] [--analysis-runs ANALYSIS_IDS]
-                          [--quiet]
+                          [--chai-gpus GPU_IDS] [--boltz-gpus GPU_IDS]
+                          [--rerun-unchanged] [--quiet]
 
 Options:
     --config CONFIG_FILE  Configuration file (default: pipeline_config.json)
@@ -33,18 +34,43 @@ Options:
     --template FILE       Template file (default: from config)
     --prediction-runs IDS Comma-separated list of prediction run IDs to run
     --analysis-runs IDS   Comma-separated list of analysis run IDs to run
+    --chai-gpus IDS       Comma-separated GPU ids for CHAI (default: first half of the GPUs)
+    --boltz-gpus IDS      Comma-separated GPU ids for BOLTZ (default: second half of the GPUs)
+    --rerun-unchanged     Rerun steps even if their inputs are unchanged since their last run
     --quiet               Suppress detailed output
 """
 
 import os
 import sys
+import time
+import shlex
 import argparse
+import threading
+import concurrent.futures
+import asyncio
 import subprocess
 import json
+import glob
+import queue
+import mmap
 import hashlib
+import tempfile
 from pathlib import Path
 from datetime import datetime
 import src.config_loader as config_loader
+from src.apptainer_jobs import detect_gpus, CONTAINER_IMAGES
+
+# Use orjson for the state file when it is available
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Use blake3 for the step fingerprints when it is available
+try:
+    import blake3
+except ImportError:
+    blake3 = None
 
 # Define pipeline steps
 PIPELINE_STEPS = [
@@ -61,6 +87,90 @@ PIPELINE_STEPS = [
     'motif-plddt'
 ]
 
+# Step tables: (id, script, description, required method, metric or other condition
+# (None: always; see the callers of build_steps),
+# ids of the steps it depends on, function building the script arguments from the
+# step context[, function giving the step's input paths or glob patterns and its
+# output glob patterns]).
+# Ids, descriptions and dependencies may use {motif}. The analysis steps list the
+# prediction steps they read from; those run in an earlier graph, so the dependency
+# only makes --resume run them again after a prediction step ran again. Steps that
+# list their files are skipped when their inputs are unchanged since they last succeeded.
+PREDICTION_STEPS = (
+    ("chai-fasta", "src/generate_chai_fasta.py", "Generating CHAI FASTA files", "chai", (),
+     lambda c: []),
+    ("chai-run", "src/run_chai_apptainer.py", "Running CHAI predictions", "chai", ("chai-fasta",),
+     lambda c: [f"--input={c['directories']['chai_fasta']}",
+                f"--output={c['directories']['chai_output']}"] + c["chai_msa_flags"] + c["chai_gpu_flag"] + c["cache_flag"]
+               + c["quiet_flag"]),
+    ("boltz-yaml", "src/generate_boltz_yaml.py", "Generating Boltz YAML files", "boltz", (),
+     lambda c: [f"--output-dir={c['boltz_yaml_dir']}"] + c["msa_flag"]),
+    # BOLTZ waits for CHAI unless they have separate GPUs (see split_prediction_gpus)
+    ("boltz-run", "src/run_boltz_apptainer.py", "Running BOLTZ predictions", "boltz", ("boltz-yaml", "chai-run"),
+     lambda c: [f"--input={c['boltz_yaml_dir']}",
+                f"--output={c['directories']['boltz_output']}"] + c["msa_flag"] + c["boltz_gpu_flag"] + c["cache_flag"]
+               + c["quiet_flag"]),
+)
+
+ANALYSIS_STEPS = (
+    ("combine-cif", "src/combine_cif_files.py", "Combining CIF files and creating PyMOL sessions", None,
+     ("chai-run", "boltz-run"),
+     lambda c: c["output_flags"] + [f"--pse-files={c['directories']['pse_files']}"]
+               + c["template_flag"] + c["method_flags"] + c["quiet_flag"]),
+    ("rmsd-plot", "src/plot_rmsd.py", "Generating RMSD heatmaps", None, ("combine-cif",),
+     lambda c: [f"--pse-files={c['directories']['pse_files']}",
+                f"--output={c['directories']['plots']}/rmsd_heatmap.png"] + c["method_flags"] + c["quiet_flag"],
+     lambda c: ([c['directories']['pse_files']], [f"{c['directories']['plots']}/rmsd_heatmap*.png"])),
+    ("plddt-plot", "src/plot_plddt.py", "Generating pLDDT heatmaps", None, ("chai-run", "boltz-run"),
+     lambda c: c["output_flags"] + [f"--output={c['directories']['plots']}/plddt_heatmap.png"]
+               + c["method_flags"] + c["quiet_flag"],
+     # Only the confidence files plot_plddt.py reads, not the (large) structure files
+     lambda c: ([f"{c['directories']['chai_output']}/**/outs.json",
+                 f"{c['directories']['boltz_output']}/*/boltz_results_*/predictions/*/confidence_*_model_0.json"],
+                [f"{c['directories']['plots']}/plddt_heatmap.png"])),
+)
+
+MOTIF_STEPS = (
+    ("combine-cif-{motif}", "src/combine_cif_files.py", "Creating base PSE files for motif {motif}", "combine",
+     ("chai-run", "boltz-run"),
+     lambda c: [f"--chai-output={c['directories']['chai_output']}",
+                f"--boltz-output={c['directories']['boltz_output']}",
+                f"--pse-files={c['analysis_run_dir']}"] + c["combine_flags"] + c["method_flags"] + c["quiet_flag"]),
+    # Base PSE files are saved for (or copied from) other analysis runs that would
+    # combine the same CIF files (see run_motif_analysis)
+    ("save-pse-{motif}", "src/copy_pse_files.py", "Saving base PSE files for motif {motif}", "save-combined",
+     ("combine-cif-{motif}",),
+     lambda c: [f"--source={c['analysis_run_dir']}", f"--dest={c['combined_dir']}", "--link", "--replace"]
+               + c["quiet_flag"]),
+    ("combine-cif-{motif}", "src/copy_pse_files.py", "Copying base PSE files for motif {motif}", "reuse-combined",
+     ("chai-run", "boltz-run"),
+     lambda c: [f"--source={c['combined_dir']}", f"--dest={c['analysis_run_dir']}"] + c["quiet_flag"]),
+    ("motif-align-{motif}", "src/motif_alignment.py", "Performing motif-specific alignment for {motif}", None,
+     ("combine-cif-{motif}", "save-pse-{motif}"),
+     lambda c: [f"--motif={c['motif']}", f"--pse-files={c['analysis_run_dir']}"] + c["quiet_flag"]),
+    ("motif-rmsd-{motif}", "src/plot_rmsd.py", "Generating motif-specific RMSD heatmap for {motif}", "rmsd",
+     ("motif-align-{motif}",),
+     lambda c: [f"--motif={c['motif']}", f"--input={c['analysis_run_dir']}",
+                f"--output={c['directories']['plots']}/motif_rmsd_heatmap_{c['motif']}.png"] + c["quiet_flag"],
+     lambda c: ([c['analysis_run_dir']], [f"{c['directories']['plots']}/motif_rmsd_heatmap_{c['motif']}.png"])),
+    ("motif-plddt-extract-{motif}", "src/extract_motif_plddt.py", "Extracting motif-specific pLDDT values for {motif}",
+     "plddt", (),
+     lambda c: [f"--motif={c['motif']}", f"--pse-files={c['analysis_run_dir']}"] + c["quiet_flag"]),
+    ("motif-plddt-plot-{motif}", "src/plot_plddt.py", "Generating motif-specific pLDDT heatmap for {motif}", "plddt",
+     ("motif-plddt-extract-{motif}",),
+     lambda c: [f"--motif={c['motif']}", f"--input={c['analysis_run_dir']}",
+                f"--output={c['directories']['plots']}/motif_plddt_heatmap_{c['motif']}.png"] + c["quiet_flag"],
+     lambda c: ([c['analysis_run_dir']], [f"{c['directories']['plots']}/motif_plddt_heatmap_{c['motif']}.png"])),
+)
+
+# --skip-step name of the table steps that are not skipped by their own id (without the
+# motif suffix)
+STEP_SKIP_IDS = {
+    "save-pse-{motif}": "combine-cif",
+    "motif-plddt-extract-{motif}": "motif-plddt",
+    "motif-plddt-plot-{motif}": "motif-plddt",
+}
+
 def parse_arguments():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(description='Run the entire protein prediction pipeline.')
@@ -83,6 +193,12 @@ def parse_arguments():
                         help='Pipeline state file (default: pipeline_state.json)')
     parser.add_argument('--clean-state', action='store_true',
                         help='Clean the state file before starting')
+    parser.add_argument('--chai-gpus', type=str,
+                        help='Comma-separated GPU ids for CHAI (default: first half of the GPUs)')
+    parser.add_argument('--boltz-gpus', type=str,
+                        help='Comma-separated GPU ids for BOLTZ (default: second half of the GPUs)')
+    parser.add_argument('--rerun-unchanged', action='store_true',
+                        help='Rerun steps even if their inputs are unchanged since their last run')
     
     # Add common arguments
     parser = config_loader.add_common_args(parser)
@@ -90,9 +206,20 @@ def parse_arguments():
     return parser.parse_args()
 
 def compute_config_hash(config):
-    """Compute a hash of the configuration to detect changes."""
+    """
+    Compute a hash of the configuration to detect changes.
+    
+    Always uses hashlib.blake2b (rather than blake3 when installed), so the hash
+    stored in the state file does not change with the installed packages.
+    """
     config_str = json.dumps(config, sort_keys=True)
-    return hashlib.md5(config_str.encode()).hexdigest()
+    return hashlib.blake2b(config_str.encode(), digest_size=16).hexdigest()
+
+def config_hash_matches(stored_hash, config, config_hash):
+    """Check a stored configuration hash, also accepting the MD5 hashes of older state files."""
+    if stored_hash == config_hash:
+        return True
+    return stored_hash == hashlib.md5(json.dumps(config, sort_keys=True).encode()).hexdigest()
 
 def read_state_file(state_file_path):
     """Read the pipeline state file."""
@@ -106,8 +233,9 @@ def read_state_file(state_file_path):
         }
     
     try:
-        with open(state_file_path, 'r') as f:
-            return json.load(f)
+        with open(state_file_path, 'rb') as f:
+            data = f.read()
+        return orjson.loads(data) if orjson else json.loads(data)
     except Exception as e:
         print(f"Error reading state file: {e}")
         return {
@@ -119,14 +247,49 @@ def read_state_file(state_file_path):
         }
 
 def write_state_file(state_file_path, state):
-    """Write the pipeline state file."""
+    """
+    Write the pipeline state file atomically.
+    
+    The state is written to a temporary file that replaces the state file, so a
+    crash mid-write never leaves a truncated state file behind for --resume.
+    """
+    tmp_path = f"{state_file_path}.tmp"
     try:
-        with open(state_file_path, 'w') as f:
-            json.dump(state, f, indent=2)
+        if orjson:
+            payload = orjson.dumps(state, option=orjson.OPT_INDENT_2)
+        else:
+            payload = json.dumps(state, indent=2).encode()
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, state_file_path)
     except Exception as e:
         print(f"Error writing state file: {e}")
 
-def update_state(state, step_id, success, error_message=None):
+def append_state_journal(state_file_path, step_id, success):
+    """
+    Append one line for a finished step to the journal next to the state file.
+    
+    Each event is a single small write to a file opened in append mode, so lines
+    are never interleaved or partially rewritten.
+    """
+    journal_path = Path(state_file_path).with_suffix(".journal")
+    line = json.dumps({"step": step_id, "ok": success, "ts": datetime.now().isoformat()}) + "\n"
+    try:
+        fd = os.open(journal_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+    except OSError as e:
+        print(f"Error writing state journal: {e}")
+
+def compute_command_hash(command):
+    """Compute a hash of a step's command line to detect changed steps on --resume."""
+    return hashlib.blake2b(json.dumps(command).encode(), digest_size=16).hexdigest()
+
+def update_state(state, step_id, success, error_message=None, command=None):
     """Update the pipeline state after a step."""
     state["last_run"] = datetime.now().isoformat()
     
@@ -134,6 +297,14 @@ def update_state(state, step_id, success, error_message=None):
         if step_id not in state["completed_steps"]:
             state["completed_steps"].append(step_id)
         
+        # Remember the command the step completed with (a step id is shared by the
+        # prediction runs, so there can be one per run)
+        if command is not None:
+            command_hash = compute_command_hash(command)
+            command_hashes = state.setdefault("step_hashes", {}).setdefault(step_id, [])
+            if command_hash not in command_hashes:
+                command_hashes.append(command_hash)
+        
         # If this was the failed step, clear it
         if state["failed_step"] == step_id:
             state["failed_step"] = None
@@ -144,151 +315,564 @@ def update_state(state, step_id, success, error_message=None):
     
     return state
 
+def is_step_completed(state, step_id, command):
+    """Check whether a step completed in a previous run with the same command."""
+    if step_id not in state["completed_steps"]:
+        return False
+    
+    # Steps recorded by older versions have no command hashes
+    if step_id not in state.get("step_hashes", {}):
+        return True
+    return compute_command_hash(command) in state["step_hashes"][step_id]
+
+# Directory holding the fingerprint each cacheable step last succeeded with
+STEP_CACHE_DIR = Path(".pipeline_cache")
+
+def hash_file(digest, path):
+    """Add a file's contents to a digest, hashing it in place through a memory map."""
+    # blake3 maps the file itself and hashes large files on several threads
+    if hasattr(digest, "update_mmap"):
+        digest.update_mmap(path)
+        return
+    
+    with open(path, 'rb') as f:
+        # Empty files cannot be mapped (and add nothing to the digest)
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                digest.update(mm)
+
+def compute_step_fingerprint(step):
+    """
+    Fingerprint a step from its command, its script, the configuration file and the
+    contents of its inputs.
+    
+    Input directories are walked in sorted order, adding each file's relative path
+    and contents, so the fingerprint only changes when an input actually changes.
+    Inputs with wildcards add the paths and contents of the files they match.
+    """
+    digest = blake3.blake3(max_threads=blake3.blake3.AUTO) if blake3 else hashlib.blake2b()
+    digest.update("\0".join(step["command"]).encode())
+    
+    # The scripts read their settings from the default configuration file
+    for path in [step["command"][1], "pipeline_config.json"] + list(step["inputs"]):
+        digest.update(b"\0" + os.fsencode(path) + b"\0")
+        if glob.has_magic(path):
+            for file_path in sorted(glob.glob(path, recursive=True)):
+                digest.update(os.fsencode(file_path) + b"\0")
+                hash_file(digest, file_path)
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    file_path = os.path.join(root, name)
+                    digest.update(os.fsencode(os.path.relpath(file_path, path)) + b"\0")
+                    hash_file(digest, file_path)
+        elif os.path.isfile(path):
+            hash_file(digest, path)
+    
+    return digest.hexdigest()
+
+def step_fingerprint_file(step):
+    """Get the file recording the fingerprint of a step (per step id and command)."""
+    command_digest = hashlib.blake2b("\0".join(step["command"]).encode(), digest_size=8).hexdigest()
+    return STEP_CACHE_DIR / f"{step['id']}-{command_digest}.hash"
+
+def is_step_unchanged(step, fingerprint):
+    """Check whether a step last succeeded with this fingerprint and its outputs still exist."""
+    try:
+        if step_fingerprint_file(step).read_text().strip() != fingerprint:
+            return False
+    except OSError:
+        return False
+    return all(glob.glob(pattern) for pattern in step["outputs"])
+
+def record_step_fingerprint(step, fingerprint):
+    """Record the fingerprint a step succeeded with (written atomically)."""
+    fingerprint_file = step_fingerprint_file(step)
+    tmp_path = fingerprint_file.with_suffix(".tmp")
+    try:
+        STEP_CACHE_DIR.mkdir(exist_ok=True)
+        tmp_path.write_text(fingerprint + "\n")
+        os.replace(tmp_path, fingerprint_file)
+    except OSError as e:
+        print(f"Error writing step fingerprint: {e}")
+
+# Run time of each step in its last successful run, in seconds
+STEP_TIMINGS_FILE = STEP_CACHE_DIR / "timings.json"
+
+def read_step_timings():
+    """Read the step run times recorded by earlier runs."""
+    try:
+        with open(STEP_TIMINGS_FILE, 'rb') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_step_timings(timings):
+    """Write the step run times (atomically)."""
+    tmp_path = STEP_TIMINGS_FILE.with_suffix(".tmp")
+    try:
+        STEP_CACHE_DIR.mkdir(exist_ok=True)
+        tmp_path.write_text(json.dumps(timings, indent=2, sort_keys=True))
+        os.replace(tmp_path, STEP_TIMINGS_FILE)
+    except OSError as e:
+        print(f"Error writing step timings: {e}")
+
 def log_message(message, level="INFO", quiet=False, state_file=None, state=None):
     """Log a message with timestamp."""
     if quiet and level == "INFO":
         return
     
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{timestamp}] [{level}] {message}")
+    # One write per line, so lines from parallel prediction runs never run together
+    # (print writes the newline separately)
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    sys.stdout.write(f"[{timestamp}] [{level}] {message}\n")
     
-    # If this is an error and we have a state file, update it
+    # If this is an error and we have a state, record it; the state file itself is
+    # only written when a step finishes
     if level == "ERROR" and state_file and state:
         state["error_message"] = message
-        write_state_file(state_file, state)
 
-def run_step(command, description, step_id, quiet=False, state_file=None, state=None):
-    """Run a pipeline step with basic error handling and state tracking."""
+# Idle pipeline_worker.py processes, reused by the Python steps
+_idle_workers = []
+
+# Serializes the state, timing and fingerprint updates of prediction runs that run in
+# parallel (each in its own thread and event loop)
+_state_lock = threading.Lock()
+
+# Ids of the steps this process ran (rather than skipped); on --resume the steps that
+# depend on them are run again even if they completed before
+_rerun_steps = set()
+
+# combine_cif_files.py arguments (hashed) of the motif analysis runs so far, each with a
+# future telling whether the first run with them saved its base PSE files; later runs
+# with the same arguments copy those files
+_combined_pse_runs = {}
+
+# How much of a quiet step's error output to keep for the log
+ERROR_TAIL_BYTES = 4096
+
+def start_worker(python="python"):
+    """Start a pipeline_worker.py process that writes script output to our stdout."""
+    sys.stdout.flush()
+    console_fd = os.dup(sys.stdout.fileno())
+    try:
+        return subprocess.Popen([python, "src/pipeline_worker.py", str(console_fd)],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                text=True, bufsize=1, pass_fds=(console_fd,))
+    finally:
+        os.close(console_fd)
+
+def stop_workers():
+    """Shut down the idle workers by closing their input."""
+    while _idle_workers:
+        worker = _idle_workers.pop()
+        worker.stdin.close()
+        worker.wait()
+
+def run_in_worker(command, quiet=False, log_file=None):
+    """
+    Run a `python script.py args...` step command in an idle worker.
+    
+    Returns:
+        tuple: (exit code, tail of the output written to log_file in quiet mode or "")
+    """
+    job = json.dumps({"script": command[1], "args": command[2:], "quiet": quiet, "log_file": log_file}) + "\n"
+    
+    while True:
+        # Steps run from several threads, so take a worker in one step
+        try:
+            worker = _idle_workers.pop()
+            fresh = False
+        except IndexError:
+            worker = start_worker(command[0])
+            fresh = True
+        
+        try:
+            worker.stdin.write(job)
+            break
+        except OSError:
+            # The worker died while idle (e.g. killed for its memory use): drop it and
+            # try the next one, unless it was just started
+            try:
+                worker.stdin.close()
+            except OSError:
+                pass
+            returncode = worker.wait()
+            if fresh:
+                return returncode or 1, ""
+    
+    reply = worker.stdout.readline()
+    
+    # A worker that died (e.g. a crash in a native library) is not reused
+    if not reply:
+        return worker.wait() or 1, ""
+    
+    _idle_workers.append(worker)
+    result = json.loads(reply)
+    return result["returncode"], result.get("stderr", "")
+
+# Quiet steps write their output to a log file here (archived with the other logs)
+STEP_LOG_DIR = Path("logs/pipeline")
+
+# The archive step moves (or deletes) logs/ while it runs, so its own log is kept
+# where archiving does not look
+ARCHIVE_STEP_LOG_DIR = STEP_CACHE_DIR / "logs"
+
+def create_step_log(step_id):
+    """Create a new, uniquely named log file for a quiet step and return its path."""
+    log_dir = ARCHIVE_STEP_LOG_DIR if step_id == "archive" else STEP_LOG_DIR
+    log_dir.mkdir(parents=True, exist_ok=True)
+    fd, log_file = tempfile.mkstemp(prefix=f"{step_id}_", suffix=".log", dir=log_dir)
+    os.close(fd)
+    return log_file
+
+def read_log_tail(log_file, max_bytes=ERROR_TAIL_BYTES):
+    """Read the last max_bytes bytes of a log file."""
+    try:
+        with open(log_file, 'rb') as f:
+            f.seek(max(0, f.seek(0, os.SEEK_END) - max_bytes))
+            return f.read().decode(errors='replace')
+    except OSError:
+        return ""
+
+async def run_step_async(command, description, step_id, quiet=False, state_file=None, state=None):
+    """Run a pipeline step as an asyncio subprocess with basic error handling and state tracking."""
     log_message(f"Running: {description}", quiet=quiet)
     
+    # Only build the command line when it is shown; shell-quoted so it can be rerun as is
     if not quiet:
-        log_message(f"Command: {' '.join(command)}")
+        log_message(f"Command: {shlex.join(command)}")
+    
+    # In quiet mode the output goes to a log file (written as it comes, so a long GPU
+    # job's output is never held in memory) and only its end is shown on failure
+    log_file = create_step_log(step_id) if quiet else None
     
     try:
-        subprocess.run(command, check=True, capture_output=quiet)
+        if command[0] == "python" and command[1].endswith(".py"):
+            # Python steps run in a long-lived worker to skip the interpreter start-up and imports
+            returncode, error_output = await asyncio.get_running_loop().run_in_executor(None, run_in_worker, command,
+                                                                                        quiet, log_file)
+        elif quiet:
+            with open(log_file, 'wb') as log:
+                process = await asyncio.create_subprocess_exec(*command, stdout=log, stderr=asyncio.subprocess.STDOUT)
+                returncode = await process.wait()
+            error_output = read_log_tail(log_file)
+        else:
+            # Otherwise the output goes straight to the terminal
+            process = await asyncio.create_subprocess_exec(*command)
+            error_output = ""
+            returncode = await process.wait()
+    except FileNotFoundError as e:
+        # The program could not be started (exit code 127, as from a shell)
+        returncode, error_output = 127, str(e)
+    
+    if returncode == 0:
         log_message(f"Completed: {description}", quiet=quiet)
         
         # Update state if tracking is enabled
         if state_file and state:
-            state = update_state(state, step_id, True)
-            write_state_file(state_file, state)
+            with _state_lock:
+                state = update_state(state, step_id, True, command=command)
+                write_state_file(state_file, state)
+                append_state_journal(state_file, step_id, True)
         
         return True
-    except subprocess.CalledProcessError as e:
-        error_message = f"Error in {description}: {e}"
-        log_message(error_message, level="ERROR", quiet=quiet, state_file=state_file, state=state)
-        
-        # Update state if tracking is enabled
-        if state_file and state:
+    
+    error_message = f"Error in {description}: {subprocess.CalledProcessError(returncode, command)}"
+    log_message(error_message, level="ERROR", quiet=quiet, state_file=state_file, state=state)
+    if error_output:
+        log_message(f"Error output of {description}:\n{error_output.rstrip()}", level="ERROR", quiet=quiet)
+    if log_file:
+        log_message(f"Full output of {description}: {log_file}", level="ERROR", quiet=quiet)
+    
+    # Update state if tracking is enabled
+    if state_file and state:
+        with _state_lock:
             state = update_state(state, step_id, False, error_message)
             write_state_file(state_file, state)
-        
-        return False
-
-def run_prediction_steps(config, args, state_file=None, state=None, run_id=None):
-    """Run prediction steps for a specific prediction run."""
-    # Define pipeline steps with standardized arguments
-    pipeline_steps = []
+            append_state_journal(state_file, step_id, False)
     
-    # Only add CHAI steps if CHAI is enabled
-    if config["methods"]["use_chai"]:
-        pipeline_steps.append({
-            "id": "chai-fasta",
-            "command": ["python", "src/generate_chai_fasta.py"],
-            "description": "Generating CHAI FASTA files"
-        })
+    return False
+
+def run_step(command, description, step_id, quiet=False, state_file=None, state=None):
+    """Run a single pipeline step and wait for it to finish."""
+    return asyncio.run(run_step_async(command, description, step_id, quiet, state_file, state))
+
+async def run_step_graph(pipeline_steps, args, state_file=None, state=None, shared_steps=None):
+    """
+    Run pipeline steps concurrently, starting each step once its dependencies are done.
+    
+    Each step lists the ids of the steps it needs in "depends_on"; skipped steps count
+    as done. Dependencies on steps of another graph (the analysis steps on the
+    prediction steps) are not waited for, but on --resume a completed step still runs
+    again when its command changed or a step it depends on ran again. Like the
+    sequential pipeline this stops at the first failure: steps that are already
+    running finish, but no further steps are started.
+    
+    The run time of each step is recorded, and the steps that took longest last time
+    are started first, so the long pole (usually a prediction run) is never queued
+    behind short steps.
+    
+    Graphs that share a shared_steps dict (the prediction runs) run each distinct
+    command once: a step whose exact command was already started by another graph
+    waits for that result instead of writing the same files again.
+    
+    Returns:
+        bool: True if every step completed (or was skipped), False otherwise
+    """
+    tasks = {}
+    failed = []
+    timings = read_step_timings()
+    
+    async def run_node(step):
+        for dep_id in step.get("depends_on", []):
+            if dep_id in tasks and not await tasks[dep_id]:
+                return False
         
-        # Add CHAI run step with appropriate arguments
-        chai_run_cmd = [
-            "python", "src/run_chai_apptainer.py",
-            f"--input={config['directories']['chai_fasta']}",
-            f"--output={config['directories']['chai_output']}"
-        ]
+        if failed:
+            return False
         
-        # Add MSA options if enabled
-        if config["methods"]["use_msa"]:
-            chai_run_cmd.append("--use-msa")
-            if config["methods"]["use_msa_dir"]:
-                chai_run_cmd.append("--use-msa-dir")
+        # Skip if explicitly requested
+        skip_id = step.get("skip_id", step["id"])
+        if skip_id in args.skip_step:
+            log_message(f"Skipping: {step['description']} (--skip-step {skip_id})", quiet=args.quiet)
+            return True
         
-        # Add quiet option if specified
-        if args.quiet:
-            chai_run_cmd.append("--quiet")
+        # Skip if already completed in a previous run (when resuming), unless one of
+        # the steps it depends on had to run again
+        if args.resume and state and step["id"] in state["completed_steps"]:
+            rerun_deps = [dep_id for dep_id in step.get("depends_on", []) if dep_id in _rerun_steps]
+            if not is_step_completed(state, step["id"], step["command"]):
+                log_message(f"Rerunning: {step['description']} (command changed since previous run)", quiet=args.quiet)
+            elif rerun_deps:
+                log_message(f"Rerunning: {step['description']} ({', '.join(rerun_deps)} ran again)", quiet=args.quiet)
+            else:
+                log_message(f"Skipping: {step['description']} (already completed in previous run)", quiet=args.quiet)
+                return True
         
-        pipeline_steps.append({
-            "id": "chai-run",
-            "command": chai_run_cmd,
-            "description": "Running CHAI predictions"
-        })
-    
-    # Only add BOLTZ steps if BOLTZ is enabled
-    if config["methods"]["use_boltz"]:
-        # Determine unique output dir for YAMLs for this run
-        run_id = config.get("id", None)
-        if run_id:
-            import os
-            base_dir = config['directories']['boltz_yaml']  # Get base dir from config
-            boltz_yaml_dir = os.path.join(base_dir, run_id)  # Create subdirectory for this run
-        else:
-            boltz_yaml_dir = config['directories']['boltz_yaml']
+        # Skip if the step's inputs are unchanged since it last succeeded
+        fingerprint = None
+        if "inputs" in step and not args.rerun_unchanged:
+            fingerprint = await asyncio.get_running_loop().run_in_executor(None, compute_step_fingerprint, step)
+            if is_step_unchanged(step, fingerprint):
+                log_message(f"Skipping: {step['description']} (inputs unchanged since last run)", quiet=args.quiet)
+                return True
         
-        # Store the specific run directory for the boltz-run step
-        boltz_run_dir = boltz_yaml_dir
-
-        # Build boltz-yaml command
-        boltz_yaml_cmd = [
-            "python", "src/generate_boltz_yaml.py",
-            f"--output-dir={boltz_yaml_dir}"
-        ]
-        if config["methods"]["use_msa"]:
-            boltz_yaml_cmd.append("--use-msa")
-        pipeline_steps.append({
-            "id": "boltz-yaml",
-            "command": boltz_yaml_cmd,
-            "description": "Generating Boltz YAML files"
-        })
+        # Reuse the result of the same command run for another prediction run
+        shared_result = None
+        if shared_steps is not None:
+            with _state_lock:
+                if tuple(step["command"]) in shared_steps:
+                    shared_result = shared_steps[tuple(step["command"])]
+                else:
+                    shared_steps[tuple(step["command"])] = concurrent.futures.Future()
+        if shared_result is not None:
+            log_message(f"Skipping: {step['description']} (same command already started for another prediction run)",
+                        quiet=args.quiet)
+            return await asyncio.wrap_future(shared_result)
         
-        # Add BOLTZ run step with appropriate arguments
-        boltz_run_cmd = [
-            "python", "src/run_boltz_apptainer.py",
-            f"--input={boltz_run_dir}",
-            f"--output={config['directories']['boltz_output']}"
-        ]
+        success = False
+        try:
+            success = await run_node_step(step, fingerprint)
+        finally:
+            if shared_steps is not None:
+                shared_steps[tuple(step["command"])].set_result(success)
+        return success
+    
+    async def run_node_step(step, fingerprint):
+        # Run the step
+        start_time = time.perf_counter()
+        if not await run_step_async(step["command"], step["description"], step["id"], args.quiet, state_file, state):
+            log_message(f"Pipeline failed at step: {step['id']}", level="ERROR", 
+                       quiet=args.quiet, state_file=state_file, state=state)
+            failed.append(step["id"])
+            return False
         
-        # Add MSA option if enabled
-        if config["methods"]["use_msa"]:
-            boltz_run_cmd.append("--use-msa")
+        with _state_lock:
+            _rerun_steps.add(step["id"])
+            if fingerprint is not None:
+                record_step_fingerprint(step, fingerprint)
+            
+            timings.update(read_step_timings())
+            timings[step["id"]] = round(time.perf_counter() - start_time, 3)
+            write_step_timings(timings)
         
-        # Add quiet option if specified
-        if args.quiet:
-            boltz_run_cmd.append("--quiet")
+        return True
+    
+    for step in sorted(pipeline_steps, key=lambda step: timings.get(step["id"], 0), reverse=True):
+        tasks[step["id"]] = asyncio.ensure_future(run_node(step))
+    
+    return all(await asyncio.gather(*tasks.values()))
+
+def get_method_flags(config):
+    """Get the --no-chai/--no-boltz/--no-msa options for the methods disabled in config."""
+    methods = config.get("methods", {})
+    return [flag for flag, enabled in [("--no-chai", methods.get("use_chai", True)),
+                                       ("--no-boltz", methods.get("use_boltz", True)),
+                                       ("--no-msa", methods.get("use_msa", True))]
+            if not enabled]
+
+def build_steps(step_table, enabled, context):
+    """
+    Build pipeline steps from a step table.
+    
+    Steps whose requirement (a method or metric) is not in enabled are left out. The
+    ids, descriptions and dependencies are formatted with the context (e.g. {motif})
+    and the command arguments (and the input and output files, for the steps that
+    list them) are built from it by each step's functions.
+    """
+    pipeline_steps = []
+    for step_id, script, description, requirement, depends_on, build_args, *build_files in step_table:
+        if requirement is not None and requirement not in enabled:
+            continue
         
-        pipeline_steps.append({
-            "id": "boltz-run",
-            "command": boltz_run_cmd,
-            "description": "Running BOLTZ predictions"
-        })
+        step = {
+            "id": step_id.format(**context),
+            "skip_id": STEP_SKIP_IDS.get(step_id, step_id.replace("-{motif}", "")),
+            "command": ["python", script] + build_args(context),
+            "description": description.format(**context),
+            "depends_on": [dep_id.format(**context) for dep_id in depends_on]
+        }
+        if build_files:
+            step["inputs"], step["outputs"] = build_files[0](context)
+        pipeline_steps.append(step)
+    return pipeline_steps
+
+# Container images already being read into the page cache by this process
+_prewarmed_images = set()
+
+# Read size used when pre-warming the container images
+PREWARM_CHUNK_BYTES = 2 * 1024 * 1024
+
+def read_into_page_cache(path):
+    """Read a file sequentially (discarding the data) so it is in the page cache."""
+    try:
+        with open(path, 'rb', buffering=0) as f:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            buffer = bytearray(PREWARM_CHUNK_BYTES)
+            while f.readinto(buffer):
+                pass
+    except OSError:
+        # Only an optimization; apptainer reports a missing image itself
+        pass
+
+def prewarm_images(images):
+    """
+    Start reading container images into the page cache in the background.
+    
+    The images are large and usually on a network filesystem, so reading them while
+    the FASTA/YAML files are generated hides the page-in time from the first
+    predictions. Each image is only read once per pipeline.
+    """
+    for image in images:
+        if image not in _prewarmed_images:
+            _prewarmed_images.add(image)
+            threading.Thread(target=read_into_page_cache, args=(image,), daemon=True).start()
+
+def split_prediction_gpus(args, gpus=None):
+    """
+    Give CHAI and BOLTZ disjoint sets of GPUs, so their predictions can run at the same time.
+    
+    Uses --chai-gpus/--boltz-gpus when given, otherwise the first and second half of
+    gpus (the detected GPUs when not given).
+    
+    Returns:
+        tuple: (CHAI GPU ids, BOLTZ GPU ids), or None if there are not enough GPUs to
+               split (both tools then use all GPUs, one after the other)
+    """
+    if args.chai_gpus and args.boltz_gpus:
+        chai_gpus, boltz_gpus = args.chai_gpus.split(','), args.boltz_gpus.split(',')
+        if set(chai_gpus) & set(boltz_gpus):
+            return None
+        return chai_gpus, boltz_gpus
+    
+    gpus = gpus or detect_gpus()
+    if len(gpus) < 2 or gpus[0] is None:
+        return None
+    
+    half = (len(gpus) + 1) // 2
+    chai_gpus, boltz_gpus = gpus[:half], gpus[half:]
+    
+    # Only one of the two given: the other tool gets the remaining GPUs
+    if args.chai_gpus:
+        chai_gpus = args.chai_gpus.split(',')
+        boltz_gpus = [gpu for gpu in gpus if gpu not in chai_gpus]
+    elif args.boltz_gpus:
+        boltz_gpus = args.boltz_gpus.split(',')
+        chai_gpus = [gpu for gpu in gpus if gpu not in boltz_gpus]
+    
+    if not chai_gpus or not boltz_gpus:
+        return None
+    return chai_gpus, boltz_gpus
+
+def run_prediction_steps(config, args, state_file=None, state=None, run_id=None, gpus=None, shared_steps=None):
+    """
+    Run prediction steps for a specific prediction run.
+    
+    gpus limits the run to some of the GPUs (when prediction runs run in parallel);
+    shared_steps is passed on to run_step_graph.
+    """
+    methods = config["methods"]
+    directories = config["directories"]
+    
+    # Determine unique output dir for YAMLs for this run
+    boltz_yaml_dir = directories['boltz_yaml']
+    if methods["use_boltz"]:
+        run_id = config.get("id", None)
+        if run_id:
+            boltz_yaml_dir = os.path.join(boltz_yaml_dir, run_id)  # Create subdirectory for this run
+    
+    # Add MSA options if enabled
+    msa_flag = ["--use-msa"] if methods["use_msa"] else []
+    chai_msa_flags = msa_flag + (["--use-msa-dir"] if methods["use_msa"] and methods["use_msa_dir"] else [])
+    
+    # With both tools enabled, run them side by side on separate GPUs when there are
+    # enough; otherwise BOLTZ waits for CHAI to finish with the GPUs
+    run_gpu_flag = [f"--gpus={','.join(gpus)}"] if gpus else []
+    chai_gpu_flag = [f"--gpus={args.chai_gpus}"] if args.chai_gpus else run_gpu_flag
+    boltz_gpu_flag = [f"--gpus={args.boltz_gpus}"] if args.boltz_gpus else run_gpu_flag
+    gpu_split = None
+    if methods["use_chai"] and methods["use_boltz"]:
+        gpu_split = split_prediction_gpus(args, gpus)
+        if gpu_split:
+            chai_gpu_flag = [f"--gpus={','.join(gpu_split[0])}"]
+            boltz_gpu_flag = [f"--gpus={','.join(gpu_split[1])}"]
+            log_message(f"Running CHAI on GPUs {','.join(gpu_split[0])} and BOLTZ on GPUs "
+                        f"{','.join(gpu_split[1])} at the same time", quiet=args.quiet)
+        else:
+            log_message("Not enough GPUs to run CHAI and BOLTZ side by side; BOLTZ will run after CHAI",
+                        quiet=args.quiet)
+    
+    # Only add the steps of the enabled prediction methods
+    enabled = {method for method in ("chai", "boltz") if methods[f"use_{method}"]}
+    prewarm_images([CONTAINER_IMAGES[method] for method in ("chai", "boltz")
+                    if method in enabled and f"{method}-run" not in args.skip_step])
+    pipeline_steps = build_steps(PREDICTION_STEPS, enabled, {
+        "directories": directories,
+        "boltz_yaml_dir": boltz_yaml_dir,
+        "msa_flag": msa_flag,
+        "chai_msa_flags": chai_msa_flags,
+        "chai_gpu_flag": chai_gpu_flag,
+        "boltz_gpu_flag": boltz_gpu_flag,
+        # Bound the prediction cache if the configuration sets a size
+        "cache_flag": [f"--cache-max-bytes={config['cache_max_bytes']}"] if config.get("cache_max_bytes") else [],
+        "quiet_flag": ["--quiet"] if args.quiet else []
+    })
+    
+    if gpu_split:
+        for step in pipeline_steps:
+            if step["id"] == "boltz-run":
+                step["depends_on"].remove("chai-run")
     
     # Run each step in the pipeline
     run_desc = f" for prediction run '{run_id}'" if run_id else ""
     log_message(f"Starting prediction steps{run_desc}", quiet=args.quiet)
     
-    for step in pipeline_steps:
-        # Skip if explicitly requested or if already completed in a previous run
-        if step["id"] in args.skip_step:
-            log_message(f"Skipping: {step['description']} (--skip-step {step['id']})", quiet=args.quiet)
-            continue
-        
-        # Skip if already completed in a previous run (when resuming)
-        if args.resume and state and step["id"] in state["completed_steps"]:
-            log_message(f"Skipping: {step['description']} (already completed in previous run)", quiet=args.quiet)
-            continue
-        
-        # Run the step
-        if not run_step(step["command"], step["description"], step["id"], args.quiet, state_file, state):
-            log_message(f"Pipeline failed at step: {step['id']}", level="ERROR", 
-                       quiet=args.quiet, state_file=state_file, state=state)
-            return False
+    # Independent steps run concurrently, each as soon as its dependencies are done
+    if not asyncio.run(run_step_graph(pipeline_steps, args, state_file, state, shared_steps)):
+        return False
     
     # If we get here, all steps completed successfully
     log_message(f"Prediction steps completed successfully{run_desc}!", quiet=args.quiet)
@@ -296,264 +880,99 @@ def run_prediction_steps(config, args, state_file=None, state=None, run_id=None)
 
 def run_whole_protein_analysis(config, args, state_file=None, state=None, run_id=None):
     """Run whole protein analysis steps."""
-    # Define pipeline steps with standardized arguments
-    pipeline_steps = []
-    
-    # Add analysis steps with appropriate arguments
-    combine_cif_cmd = [
-        "python", "src/combine_cif_files.py",
-        f"--chai-output={config['directories']['chai_output']}",
-        f"--boltz-output={config['directories']['boltz_output']}",
-        f"--pse-files={config['directories']['pse_files']}"
-    ]
-    
-    # Add template if specified in command line
-    if args.template:
-        combine_cif_cmd.append(f"--template={args.template}")
-    
-    # Add method options
-    if not config.get("methods", {}).get("use_chai", True):
-        combine_cif_cmd.append("--no-chai")
-    if not config.get("methods", {}).get("use_boltz", True):
-        combine_cif_cmd.append("--no-boltz")
-    if not config.get("methods", {}).get("use_msa", True):
-        combine_cif_cmd.append("--no-msa")
-    
-    # Add quiet option if specified
-    if args.quiet:
-        combine_cif_cmd.append("--quiet")
-    
-    pipeline_steps.append({
-        "id": "combine-cif",
-        "command": combine_cif_cmd,
-        "description": "Combining CIF files and creating PyMOL sessions"
-    })
-    
-    # Add RMSD plot step
-    rmsd_plot_cmd = [
-        "python", "src/plot_rmsd.py",
-        f"--pse-files={config['directories']['pse_files']}",
-        f"--output={config['directories']['plots']}/rmsd_heatmap.png"
-    ]
-    
-    # Add method options
-    if not config.get("methods", {}).get("use_chai", True):
-        rmsd_plot_cmd.append("--no-chai")
-    if not config.get("methods", {}).get("use_boltz", True):
-        rmsd_plot_cmd.append("--no-boltz")
-    if not config.get("methods", {}).get("use_msa", True):
-        rmsd_plot_cmd.append("--no-msa")
-    
-    # Add quiet option if specified
-    if args.quiet:
-        rmsd_plot_cmd.append("--quiet")
-    
-    pipeline_steps.append({
-        "id": "rmsd-plot",
-        "command": rmsd_plot_cmd,
-        "description": "Generating RMSD heatmaps"
-    })
-    
-    # Add pLDDT plot step
-    plddt_plot_cmd = [
-        "python", "src/plot_plddt.py",
-        f"--chai-output={config['directories']['chai_output']}",
-        f"--boltz-output={config['directories']['boltz_output']}",
-        f"--output={config['directories']['plots']}/plddt_heatmap.png"
-    ]
-    
-    # Add method options
-    if not config.get("methods", {}).get("use_chai", True):
-        plddt_plot_cmd.append("--no-chai")
-    if not config.get("methods", {}).get("use_boltz", True):
-        plddt_plot_cmd.append("--no-boltz")
-    if not config.get("methods", {}).get("use_msa", True):
-        plddt_plot_cmd.append("--no-msa")
-    
-    # Add quiet option if specified
-    if args.quiet:
-        plddt_plot_cmd.append("--quiet")
-    
-    pipeline_steps.append({
-        "id": "plddt-plot",
-        "command": plddt_plot_cmd,
-        "description": "Generating pLDDT heatmaps"
+    directories = config["directories"]
+    pipeline_steps = build_steps(ANALYSIS_STEPS, set(), {
+        "directories": directories,
+        "output_flags": [
+            f"--chai-output={directories['chai_output']}",
+            f"--boltz-output={directories['boltz_output']}"
+        ],
+        # Add template if specified in command line
+        "template_flag": [f"--template={args.template}"] if args.template else [],
+        "method_flags": get_method_flags(config),
+        "quiet_flag": ["--quiet"] if args.quiet else []
     })
     
     # Run each step in the pipeline
     run_desc = f" for analysis run '{run_id}'" if run_id else ""
     log_message(f"Starting whole protein analysis{run_desc}", quiet=args.quiet)
     
-    for step in pipeline_steps:
-        # Skip if explicitly requested or if already completed in a previous run
-        if step["id"] in args.skip_step:
-            log_message(f"Skipping: {step['description']} (--skip-step {step['id']})", quiet=args.quiet)
-            continue
-        
-        # Skip if already completed in a previous run (when resuming)
-        if args.resume and state and step["id"] in state["completed_steps"]:
-            log_message(f"Skipping: {step['description']} (already completed in previous run)", quiet=args.quiet)
-            continue
-        
-        # Run the step
-        if not run_step(step["command"], step["description"], step["id"], args.quiet, state_file, state):
-            log_message(f"Pipeline failed at step: {step['id']}", level="ERROR", 
-                       quiet=args.quiet, state_file=state_file, state=state)
-            return False
+    # Independent steps run concurrently, each as soon as its dependencies are done
+    if not asyncio.run(run_step_graph(pipeline_steps, args, state_file, state)):
+        return False
     
     # If we get here, all steps completed successfully
     log_message(f"Whole protein analysis completed successfully{run_desc}!", quiet=args.quiet)
     return True
 
-def run_motif_analysis(config, args, state_file=None, state=None, run_id=None, motif_id=None, metrics=None, full_config=None):
-    """Run motif-specific analysis steps."""
-    # Define pipeline steps with standardized arguments
-    pipeline_steps = []
+def run_motif_analysis(config, args, state_file=None, state=None, run_id=None, motif_id=None, metrics=None, full_config=None,
+                       motif_def=None):
+    """Run motif-specific analysis steps (motif_def is looked up unless the caller already has it)."""
+    directories = config["directories"]
     
     # Get motif definition from full_config if provided, otherwise from config
-    if full_config:
-        motif_def = config_loader.get_motif_definition(full_config, motif_id)
-    else:
-        motif_def = config_loader.get_motif_definition(config, motif_id)
+    if motif_def is None:
+        motif_def = config_loader.get_motif_definition(full_config or config, motif_id)
         
     if not motif_def:
         log_message(f"Motif '{motif_id}' not found in configuration", level="ERROR", quiet=args.quiet)
         return False
     
-    # Create a directory for this analysis run
-    pse_base_dir = Path(config["directories"]["pse_files"])
-    # Create the base directory if it doesn't exist
-    pse_base_dir.mkdir(exist_ok=True, parents=True)
-    analysis_run_dir = pse_base_dir / run_id
-    analysis_run_dir.mkdir(exist_ok=True)
-    
-    # Add combine_cif_files step first to create base PSE files
-    combine_cif_cmd = [
-        "python", "src/combine_cif_files.py",
-        f"--chai-output={config['directories']['chai_output']}",
-        f"--boltz-output={config['directories']['boltz_output']}",
-        f"--pse-files={analysis_run_dir}"  # Use the analysis run directory
-    ]
-    
-    # Add template if specified in motif definition
-    if "template" in motif_def:
-        combine_cif_cmd.append(f"--template={motif_def['template']}")
+    # Create a directory for this analysis run (and the base directory, if it doesn't
+    # exist; mkdir only walks up to the parents when the first attempt fails)
+    analysis_run_dir = Path(directories["pse_files"]) / run_id
+    analysis_run_dir.mkdir(exist_ok=True, parents=True)
     
-    # Add molecules if specified in motif definition
+    # Add template and molecules if specified in motif definition
+    combine_flags = []
+    if "template" in motif_def:
+        combine_flags.append(f"--template={motif_def['template']}")
     if "molecules" in motif_def and motif_def["molecules"]:
-        molecules_str = ",".join(motif_def["molecules"])
-        combine_cif_cmd.append(f"--molecules={molecules_str}")
-    
-    # Add method options
-    if not config.get("methods", {}).get("use_chai", True):
-        combine_cif_cmd.append("--no-chai")
-    if not config.get("methods", {}).get("use_boltz", True):
-        combine_cif_cmd.append("--no-boltz")
-    if not config.get("methods", {}).get("use_msa", True):
-        combine_cif_cmd.append("--no-msa")
-    
-    # Add quiet option if specified
-    if args.quiet:
-        combine_cif_cmd.append("--quiet")
-    
-    pipeline_steps.append({
-        "id": f"combine-cif-{motif_id}",
-        "command": combine_cif_cmd,
-        "description": f"Creating base PSE files for motif {motif_id}"
-    })
-    
-    # Add motif alignment step
-    motif_align_cmd = [
-        "python", "src/motif_alignment.py",
-        f"--motif={motif_id}",
-        f"--pse-files={analysis_run_dir}"  # Use the analysis run directory
-    ]
-    
-    # Add quiet option if specified
-    if args.quiet:
-        motif_align_cmd.append("--quiet")
-    
-    pipeline_steps.append({
-        "id": f"motif-align-{motif_id}",
-        "command": motif_align_cmd,
-        "description": f"Performing motif-specific alignment for {motif_id}"
+        combine_flags.append(f"--molecules={','.join(motif_def['molecules'])}")
+    method_flags = get_method_flags(config)
+    
+    # combine_cif_files.py gives the same base PSE files for the same inputs, template,
+    # molecules and methods: the first analysis run saves them and later ones copy them
+    # (once it has completed, waiting for it if it runs in parallel)
+    combined_key = compute_command_hash([directories["chai_output"], directories["boltz_output"]]
+                                        + combine_flags + method_flags)
+    with _state_lock:
+        combined_run = _combined_pse_runs.get(combined_key)
+        if combined_run is None:
+            _combined_pse_runs[combined_key] = concurrent.futures.Future()
+    if combined_run is None:
+        combine_steps = {"combine", "save-combined"}
+    elif combined_run.result():
+        combine_steps = {"reuse-combined"}
+    else:
+        # The first run failed, so combine the CIF files again (without saving them)
+        combine_steps = {"combine"}
+    
+    # Only add the steps of the enabled metrics (all of them if none are given)
+    enabled = set(metrics or ["rmsd", "plddt"]) | combine_steps
+    pipeline_steps = build_steps(MOTIF_STEPS, enabled, {
+        "motif": motif_id,
+        "directories": directories,
+        "analysis_run_dir": analysis_run_dir,
+        "combined_dir": STEP_CACHE_DIR / "pse" / combined_key,
+        "combine_flags": combine_flags,
+        "method_flags": method_flags,
+        "quiet_flag": ["--quiet"] if args.quiet else []
     })
     
-    # Add motif RMSD plot step if RMSD metric is enabled
-    if not metrics or "rmsd" in metrics:
-        motif_rmsd_cmd = [
-            "python", "src/plot_rmsd.py",
-            f"--motif={motif_id}",
-            f"--input={analysis_run_dir}",
-            f"--output={config['directories']['plots']}/motif_rmsd_heatmap_{motif_id}.png"
-        ]
-        
-        # Add quiet option if specified
-        if args.quiet:
-            motif_rmsd_cmd.append("--quiet")
-        
-        pipeline_steps.append({
-            "id": f"motif-rmsd-{motif_id}",
-            "command": motif_rmsd_cmd,
-            "description": f"Generating motif-specific RMSD heatmap for {motif_id}"
-        })
-    
-    # Add motif pLDDT extraction and plot steps if pLDDT metric is enabled
-    if not metrics or "plddt" in metrics:
-        motif_plddt_extract_cmd = [
-            "python", "src/extract_motif_plddt.py",
-            f"--motif={motif_id}",
-            f"--pse-files={analysis_run_dir}"  # Use the analysis run directory
-        ]
-        
-        # Add quiet option if specified
-        if args.quiet:
-            motif_plddt_extract_cmd.append("--quiet")
-        
-        pipeline_steps.append({
-            "id": f"motif-plddt-extract-{motif_id}",
-            "command": motif_plddt_extract_cmd,
-            "description": f"Extracting motif-specific pLDDT values for {motif_id}"
-        })
-        
-        motif_plddt_plot_cmd = [
-            "python", "src/plot_plddt.py",
-            f"--motif={motif_id}",
-            f"--input={analysis_run_dir}",
-            f"--output={config['directories']['plots']}/motif_plddt_heatmap_{motif_id}.png"
-        ]
-        
-        # Add quiet option if specified
-        if args.quiet:
-            motif_plddt_plot_cmd.append("--quiet")
-        
-        pipeline_steps.append({
-            "id": f"motif-plddt-plot-{motif_id}",
-            "command": motif_plddt_plot_cmd,
-            "description": f"Generating motif-specific pLDDT heatmap for {motif_id}"
-        })
-    
     # Run each step in the pipeline
     run_desc = f" for analysis run '{run_id}'" if run_id else ""
     log_message(f"Starting motif-specific analysis for {motif_id}{run_desc}", quiet=args.quiet)
     
-    for step in pipeline_steps:
-        # Skip if explicitly requested
-        base_step_id = step["id"].split("-")[0] + "-" + step["id"].split("-")[1]
-        if base_step_id in args.skip_step:
-            log_message(f"Skipping: {step['description']} (--skip-step {base_step_id})", quiet=args.quiet)
-            continue
-        
-        # Skip if already completed in a previous run (when resuming)
-        if args.resume and state and step["id"] in state["completed_steps"]:
-            log_message(f"Skipping: {step['description']} (already completed in previous run)", quiet=args.quiet)
-            continue
-        
-        # Run the step
-        if not run_step(step["command"], step["description"], step["id"], args.quiet, state_file, state):
-            log_message(f"Pipeline failed at step: {step['id']}", level="ERROR", 
-                       quiet=args.quiet, state_file=state_file, state=state)
-            return False
+    # Independent steps run concurrently, each as soon as its dependencies are done
+    success = False
+    try:
+        success = asyncio.run(run_step_graph(pipeline_steps, args, state_file, state))
+    finally:
+        if combined_run is None:
+            _combined_pse_runs[combined_key].set_result(success)
+    if not success:
+        return False
     
     # If we get here, all steps completed successfully
     log_message(f"Motif-specific analysis for {motif_id} completed successfully{run_desc}!", quiet=args.quiet)
@@ -570,56 +989,41 @@ def run_analysis_steps(config, full_config, args, state_file=None, state=None, r
             log_message(f"Motif '{motif_id}' not found in configuration", level="ERROR", quiet=args.quiet)
             return False
         
-        return run_motif_analysis(config, args, state_file, state, run_id, motif_id, metrics, full_config)
+        return run_motif_analysis(config, args, state_file, state, run_id, motif_id, metrics, full_config, motif_def)
     else:
         log_message(f"Unknown analysis type: {analysis_type}", level="ERROR", quiet=args.quiet)
         return False
 
+def set_runs_enabled(runs, run_ids, enabled):
+    """Enable or disable the runs with the given ids (a command-line override)."""
+    if not run_ids:
+        return
+    run_ids = set(run_ids)
+    for run in runs:
+        if run.get("id") in run_ids:
+            run["enabled"] = enabled
+
 def main():
     """Main function."""
     args = parse_arguments()
     
+    # Checked for every step
+    args.skip_step = frozenset(args.skip_step)
+    
     # Load configuration
     full_config = config_loader.load_config(args.config)
     
     # Apply command-line configuration overrides for backwards compatibility
-    if args.enable_config:
-        for config_id in args.enable_config:
-            for cfg in full_config.get("prediction_runs", []):
-                if cfg.get("id") == config_id:
-                    cfg["enabled"] = True
-    
-    if args.disable_config:
-        for config_id in args.disable_config:
-            for cfg in full_config.get("prediction_runs", []):
-                if cfg.get("id") == config_id:
-                    cfg["enabled"] = False
+    set_runs_enabled(full_config.get("prediction_runs", []), args.enable_config, True)
+    set_runs_enabled(full_config.get("prediction_runs", []), args.disable_config, False)
     
     # Apply command-line configuration overrides for prediction runs
-    if args.enable_prediction:
-        for pred_id in args.enable_prediction:
-            for pred in full_config.get("prediction_runs", []):
-                if pred.get("id") == pred_id:
-                    pred["enabled"] = True
-    
-    if args.disable_prediction:
-        for pred_id in args.disable_prediction:
-            for pred in full_config.get("prediction_runs", []):
-                if pred.get("id") == pred_id:
-                    pred["enabled"] = False
+    set_runs_enabled(full_config.get("prediction_runs", []), args.enable_prediction, True)
+    set_runs_enabled(full_config.get("prediction_runs", []), args.disable_prediction, False)
     
     # Apply command-line configuration overrides for analysis runs
-    if args.enable_analysis:
-        for analysis_id in args.enable_analysis:
-            for analysis in full_config.get("analysis_runs", []):
-                if analysis.get("id") == analysis_id:
-                    analysis["enabled"] = True
-    
-    if args.disable_analysis:
-        for analysis_id in args.disable_analysis:
-            for analysis in full_config.get("analysis_runs", []):
-                if analysis.get("id") == analysis_id:
-                    analysis["enabled"] = False
+    set_runs_enabled(full_config.get("analysis_runs", []), args.enable_analysis, True)
+    set_runs_enabled(full_config.get("analysis_runs", []), args.disable_analysis, False)
     
     # Initialize state tracking if resume is enabled
     state_file = None
@@ -629,20 +1033,22 @@ def main():
         state_file = args.state_file
         state = read_state_file(state_file)
         
+        # The configuration doesn't change from here on, so hash it only once
+        config_hash = compute_config_hash(full_config)
+        
         # Clean state if requested
         if args.clean_state:
             state = {
                 "last_run": datetime.now().isoformat(),
-                "config_hash": compute_config_hash(full_config),
+                "config_hash": config_hash,
                 "completed_steps": [],
                 "failed_step": None,
                 "error_message": None
             }
-            write_state_file(state_file, state)
             log_message(f"Cleaned state file: {state_file}", quiet=args.quiet)
         
         # Check if configuration has changed
-        if args.resume and state["config_hash"] and state["config_hash"] != compute_config_hash(full_config):
+        if args.resume and state["config_hash"] and not config_hash_matches(state["config_hash"], full_config, config_hash):
             if not args.force_resume:
                 log_message("Configuration has changed since last run. Use --force-resume to ignore this warning.", 
                            level="ERROR", quiet=args.quiet)
@@ -651,9 +1057,11 @@ def main():
                 log_message("Configuration has changed, but continuing due to --force-resume", 
                            level="WARNING", quiet=args.quiet)
         
-        # Update config hash
-        state["config_hash"] = compute_config_hash(full_config)
-        write_state_file(state_file, state)
+        # Update config hash (one write for a cleaned state too; nothing to write when
+        # resuming with the same hash)
+        if args.clean_state or state["config_hash"] != config_hash:
+            state["config_hash"] = config_hash
+            write_state_file(state_file, state)
         
         if args.resume and state["completed_steps"]:
             log_message(f"Resuming pipeline. Completed steps: {', '.join(state['completed_steps'])}", quiet=args.quiet)
@@ -664,7 +1072,7 @@ def main():
     # Step 1: Archive previous outputs (if not resuming or if not completed)
     if not args.resume or 'archive' not in state["completed_steps"]:
         if 'archive' not in args.skip_step:
-            archive_cmd = ["python", "src/archive_and_clean.py"]
+            archive_cmd = ["python", "src/archive_and_clean.py", f"--workers={os.cpu_count() or 8}"]
             if args.no_archive:
                 archive_cmd.append("--no-archive")
             if args.delete_outputs:
@@ -695,7 +1103,26 @@ def main():
     for run in enabled_prediction_runs:
         print(f"  - {run.get('id')}: {run.get('description')}, use_msa={run.get('methods', {}).get('use_msa', False)}")
     
-    for pred_run in enabled_prediction_runs:
+    # Prediction runs write to separate output folders, so up to max_parallel_runs of
+    # them can run at the same time, each on its own share of the GPUs
+    max_parallel_runs = max(1, min(full_config.get("global", {}).get("max_parallel_runs", 1),
+                                   len(enabled_prediction_runs)))
+    run_gpus = [None] * max_parallel_runs
+    if max_parallel_runs > 1:
+        gpus = detect_gpus()
+        if len(gpus) >= max_parallel_runs and gpus[0] is not None:
+            run_gpus = [gpus[i::max_parallel_runs] for i in range(max_parallel_runs)]
+        log_message(f"Running up to {max_parallel_runs} prediction runs in parallel", quiet=args.quiet)
+    
+    # Each running prediction run checks a share of the GPUs out of this queue
+    gpu_shares = queue.Queue()
+    for share in run_gpus:
+        gpu_shares.put(share)
+    
+    # Commands shared by the prediction runs (e.g. generating the FASTA files) run once
+    shared_steps = {}
+    
+    def run_prediction(pred_run):
         run_id = pred_run.get("id", "unknown")
         use_msa = pred_run.get("methods", {}).get("use_msa", False)
         log_message(f"Running prediction run: {run_id} - {pred_run.get('description', '')}, use_msa={use_msa}", quiet=args.quiet)
@@ -714,10 +1141,21 @@ def main():
         print(f"  - use_msa: {merged_config.get('methods', {}).get('use_msa', False)}")
         
         # Run the prediction steps with this prediction run
-        if not run_prediction_steps(merged_config, args, state_file, state, run_id):
-            prediction_success = False
+        share = gpu_shares.get()
+        try:
+            success = run_prediction_steps(merged_config, args, state_file, state, run_id, share, shared_steps)
+        finally:
+            gpu_shares.put(share)
+        
+        if not success:
             log_message(f"Pipeline failed for prediction run: {run_id}", level="ERROR", 
                        quiet=args.quiet, state_file=state_file, state=state)
+        return success
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel_runs) as executor:
+        results = list(executor.map(run_prediction, enabled_prediction_runs))
+    if not all(results):
+        prediction_success = False
     
     # Step 3: Run analysis steps
     # Get enabled analysis runs
@@ -728,9 +1166,18 @@ def main():
     else:
         log_message(f"Found {len(enabled_analysis_runs)} enabled analysis runs", quiet=args.quiet)
         
-        # Run each enabled analysis run
-        analysis_success = True
-        for analysis_run in enabled_analysis_runs:
+        # Motif analysis runs write to their own directories, so up to max_parallel_runs of
+        # them can run at the same time; whole-protein runs share the PSE and plot
+        # directories and run one at a time
+        max_parallel_analyses = max(1, min(full_config.get("global", {}).get("max_parallel_runs", 1),
+                                           len(enabled_analysis_runs)))
+        whole_protein_lock = threading.Lock()
+        
+        # Analysis runs with the same source prediction run share its merged configuration
+        # (only read by the analysis steps)
+        merged_configs = {}
+        
+        def run_analysis(analysis_run):
             run_id = analysis_run.get("id", "unknown")
             log_message(f"Running analysis run: {run_id} - {analysis_run.get('description', '')}", quiet=args.quiet)
             
@@ -738,7 +1185,7 @@ def main():
             source_prediction_ids = analysis_run.get("source_predictions", [])
             if not source_prediction_ids:
                 log_message(f"No source predictions specified for analysis run: {run_id}", level="WARNING", quiet=args.quiet)
-                continue
+                return True
             
             # Get the first source prediction run to use as a base
             source_run = None
@@ -749,26 +1196,41 @@ def main():
             
             if not source_run:
                 log_message(f"No valid source prediction runs found for analysis run: {run_id}", level="ERROR", quiet=args.quiet)
-                continue
-            
-            # Merge global config with the source prediction run
-            merged_config = config_loader.deep_merge(full_config.get("global", {}), source_run)
+                return True
             
-            # Update with command line arguments
-            merged_config = config_loader.update_config_from_args(merged_config, args)
+            merged_config = merged_configs.get(source_run.get("id"))
+            if merged_config is None:
+                # Merge global config with the source prediction run
+                merged_config = config_loader.deep_merge(full_config.get("global", {}), source_run)
+                
+                # Update with command line arguments
+                merged_config = config_loader.update_config_from_args(merged_config, args)
+                merged_configs[source_run.get("id")] = merged_config
             
             # Run the analysis steps with this analysis run
             analysis_type = analysis_run.get("analysis_type")
             motif_id = analysis_run.get("motif_id")
             metrics = analysis_run.get("metrics")
             
-            if not run_analysis_steps(merged_config, full_config, args, state_file, state, run_id, analysis_type, motif_id, metrics):
-                analysis_success = False
+            if analysis_type == "motif":
+                success = run_analysis_steps(merged_config, full_config, args, state_file, state, run_id,
+                                             analysis_type, motif_id, metrics)
+            else:
+                with whole_protein_lock:
+                    success = run_analysis_steps(merged_config, full_config, args, state_file, state, run_id,
+                                                 analysis_type, motif_id, metrics)
+            
+            if not success:
                 log_message(f"Pipeline failed for analysis run: {run_id}", level="ERROR", 
                            quiet=args.quiet, state_file=state_file, state=state)
+            return success
+        
+        # Run each enabled analysis run
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel_analyses) as executor:
+            analysis_success = all(list(executor.map(run_analysis, enabled_analysis_runs)))
     
     # Clear the failed step if we completed successfully
-    if prediction_success and state_file and state:
+    if prediction_success and state_file and state and state["failed_step"] is not None:
         state["failed_step"] = None
         state["error_message"] = None
         write_state_file(state_file, state)
@@ -776,4 +1238,7 @@ def main():
     return 0 if prediction_success else 1
 
 if __name__ == "__main__":
-    sys.exit(main())
+    try:
+        sys.exit(main())
+    finally:
+        stop_workers()
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for running structure predictions in Apptainer containers.
+
+run_chai_apptainer.py and run_boltz_apptainer.py only build the prediction
+commands for their tool; this module runs them. It provides:
+
+1. GPU detection and one prediction per GPU at a time (run_jobs)
+2. A shared container instance for all the predictions of a run
+3. The prediction cache: finished predictions are stored (as hard links) under a
+   key computed from the input file, the extra arguments and the container image,
+   and restored instead of being rerun
+4. Fast scans of the input folders and of the existing outputs
+
+It is not run on its own.
+"""
+
+import os
+import mmap
+import queue
+import shutil
+import hashlib
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+# Container images of the prediction tools
+CONTAINER_IMAGES = {
+    "chai": "/emcc/westberg/shared/containers/chai.sif",
+    "boltz": "/emcc/westberg/shared/containers/boltz.sif",
+}
+
+def run_command(image):
+    """Command that starts the container for a single prediction."""
+    return ["apptainer", "run", "--nv", image]
+
+def detect_gpus():
+    """
+    Detect the GPUs available for predictions.
+    
+    Uses CUDA_VISIBLE_DEVICES when it is set, otherwise the GPUs listed by nvidia-smi.
+    
+    Returns:
+        list: GPU ids as strings, or [None] if none were found (the environment is
+              then passed through unchanged and predictions run one at a time)
+    """
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is not None:
+        gpus = [gpu.strip() for gpu in visible.split(',') if gpu.strip()]
+    else:
+        try:
+            result = subprocess.run(["nvidia-smi", "-L"], capture_output=True, text=True)
+        except OSError:
+            result = None
+        gpus = []
+        if result is not None and result.returncode == 0:
+            gpus = [str(i) for i, line in enumerate(result.stdout.splitlines()) if line.startswith("GPU")]
+    return gpus or [None]
+
+def file_digest(path):
+    """
+    Start a blake2b digest of a file's contents.
+    
+    The file is memory-mapped and hashed in place instead of being read into a bytes
+    copy first.
+    """
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        # Empty files cannot be mapped (and add nothing to the digest)
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                digest.update(mm)
+    return digest
+
+def directory_digest(path):
+    """
+    Hash the relative paths and contents of all files in a directory (e.g. an MSA
+    directory the predictions read), walked in sorted order.
+    
+    Returns:
+        str: Hex digest (the same for an empty or missing directory)
+    """
+    digest = hashlib.blake2b()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            digest.update(os.fsencode(os.path.relpath(file_path, path)) + b"\0")
+            digest.update(file_digest(file_path).digest())
+    return digest.hexdigest()
+
+def compute_cache_key(input_file, extra_args, image):
+    """
+    Compute the cache key for a prediction.
+    
+    The key covers the input file name and contents, the extra command-line
+    arguments (MSA options, plus e.g. the directory_digest of an MSA directory) and
+    the container image. The image is identified by its path, size and
+    modification time rather than by hashing the whole image.
+    """
+    digest = file_digest(input_file)
+    digest.update(b"|" + Path(input_file).name.encode())
+    digest.update(b"|" + "|".join(extra_args).encode())
+    try:
+        image_stat = os.stat(image)
+        image_id = f"{image}:{image_stat.st_size}:{image_stat.st_mtime_ns}"
+    except OSError:
+        image_id = image
+    digest.update(b"|" + image_id.encode())
+    return digest.hexdigest()
+
+def link_or_copy(src, dst):
+    """Hard-link src to dst, falling back to a copy (e.g. across filesystems)."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def restore_from_cache(cache_entry, result_dir):
+    """
+    Restore a cached prediction into result_dir by hard-linking its files.
+    
+    Returns:
+        bool: True if a completed prediction was found in the cache and restored
+    """
+    cached_output = cache_entry / "output"
+    if not (cache_entry / "DONE").exists() or not cached_output.is_dir():
+        return False
+    
+    shutil.copytree(cached_output, result_dir, copy_function=link_or_copy, dirs_exist_ok=True)
+    
+    # Mark the entry as recently used for evict_cache
+    os.utime(cache_entry / "DONE")
+    return True
+
+def store_in_cache(cache_entry, result_dir):
+    """
+    Store a finished prediction in the cache (as hard links) and mark it done.
+    
+    The files are linked into a private staging directory that is then renamed into
+    place, so two jobs storing the same key (the same input in two folders) never
+    write into the same directory. Errors are reported rather than raised: the
+    prediction itself has finished, only caching it failed.
+    """
+    if not result_dir.is_dir():
+        return
+    
+    cached_output = cache_entry / "output"
+    staging = None
+    replaced = None
+    try:
+        cache_entry.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=".output-", dir=cache_entry))
+        shutil.copytree(result_dir, staging, copy_function=link_or_copy, dirs_exist_ok=True)
+        
+        # A directory cannot be renamed over a non-empty one, so move an existing
+        # output (e.g. left by an interrupted store) aside first
+        replaced = staging.with_name(staging.name + ".old")
+        try:
+            os.rename(cached_output, replaced)
+        except FileNotFoundError:
+            replaced = None
+        
+        try:
+            os.rename(staging, cached_output)
+        except OSError:
+            # Another job with the same key stored its (identical) output first
+            if not cached_output.is_dir():
+                raise
+            return
+        staging = None
+        (cache_entry / "DONE").write_text(datetime.now().isoformat() + "\n")
+    except OSError as e:
+        print(f"Warning: could not cache {result_dir}: {e}")
+    finally:
+        for path in (staging, replaced):
+            if path is not None:
+                shutil.rmtree(path, ignore_errors=True)
+
+def evict_cache(cache_root, max_bytes):
+    """
+    Remove the least recently used cache entries until the cache fits in max_bytes.
+    
+    An entry's last use is the modification time of its DONE marker (set when it is
+    stored or restored); unfinished entries count as the oldest.
+    
+    Only files the cache holds the sole link to are counted: files still hard-linked
+    from an output or archive directory take no extra space in the cache, and
+    deleting the entry would not free them.
+    """
+    entries = []
+    total = 0
+    try:
+        with os.scandir(cache_root) as it:
+            for entry in it:
+                if not entry.is_dir():
+                    continue
+                size = 0
+                for root, dirs, files in os.walk(entry.path):
+                    for name in files:
+                        file_stat = os.lstat(os.path.join(root, name))
+                        if file_stat.st_nlink == 1:
+                            size += file_stat.st_size
+                try:
+                    last_used = os.stat(os.path.join(entry.path, "DONE")).st_mtime
+                except FileNotFoundError:
+                    last_used = 0
+                entries.append((last_used, size, entry.path))
+                total += size
+    except FileNotFoundError:
+        return
+    
+    for last_used, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+def run_prediction(cmd, input_file, result_dir, cache_entry, log_file, gpu_queue, quiet=False):
+    """
+    Run a single apptainer command on a GPU checked out from gpu_queue.
+    
+    In quiet mode the command's output is written straight to log_file. The output
+    in result_dir is stored under cache_entry (unless it is None) if the prediction
+    succeeds. The GPU is handed back as soon as the container exits, so the next
+    prediction runs on it while this one's output is being cached.
+    """
+    gpu_id = gpu_queue.get()
+    try:
+        env = None
+        if gpu_id is not None:
+            env = dict(os.environ, CUDA_VISIBLE_DEVICES=gpu_id)
+        
+        if not quiet:
+            print(f"Processing: {input_file}" + (f" on GPU {gpu_id}" if gpu_id is not None else ""))
+        
+        if quiet:
+            # The container writes its output straight to the log file, so nothing is
+            # read through pipes for the whole (possibly hours-long) run
+            log_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(log_file, 'wb') as log:
+                result = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT, env=env)
+        else:
+            result = subprocess.run(cmd, env=env)
+    finally:
+        gpu_queue.put(gpu_id)
+    
+    if result.returncode != 0:
+        # Report the failure and carry on with the other predictions
+        print(f"Failed: {input_file} (exit code {result.returncode})" + (f", output in {log_file}" if quiet else ""))
+        return
+    
+    if cache_entry is not None:
+        store_in_cache(cache_entry, result_dir)
+    
+    if not quiet:
+        print(f"Completed: {input_file}\n")
+
+def scan_input_folders(input_dir, suffix):
+    """
+    List the input files in each subfolder of input_dir.
+    
+    Uses one os.scandir per directory, so folders are recognised from the directory
+    entries without a stat call per entry.
+    
+    Returns:
+        list: (folder name, list of input file Paths) for each subfolder
+    """
+    folders = []
+    with os.scandir(input_dir) as it:
+        for entry in it:
+            if entry.is_dir():
+                with os.scandir(entry.path) as files:
+                    input_files = [Path(f.path) for f in files if f.name.endswith(suffix)]
+                folders.append((entry.name, input_files))
+    return folders
+
+# Number of threads listing result directories (hides the latency of network filesystems)
+SCAN_WORKERS = 32
+
+def has_entries(directory, names):
+    """Check whether a directory contains all the given entry names (one scandir)."""
+    try:
+        with os.scandir(directory) as it:
+            return names <= {entry.name for entry in it}
+    except OSError:
+        return False
+
+def find_finished_dirs(output_dir, names, prefix=""):
+    """
+    Find the finished predictions in an output directory.
+    
+    The output directory is scanned once; its result directories (those starting
+    with prefix) are then listed concurrently from a thread pool, since each
+    listing is a round trip on a network filesystem.
+    
+    Returns:
+        set: Names of the result directories that already contain all the given
+             entry names
+    """
+    try:
+        with os.scandir(output_dir) as it:
+            candidates = [entry for entry in it if entry.name.startswith(prefix) and entry.is_dir()]
+    except FileNotFoundError:
+        return set()
+    
+    if not candidates:
+        return set()
+    
+    with ThreadPoolExecutor(max_workers=min(SCAN_WORKERS, len(candidates))) as executor:
+        finished = executor.map(lambda entry: has_entries(entry.path, names), candidates)
+        return {entry.name for entry, done in zip(candidates, finished) if done}
+
+def start_instance(image, quiet=False):
+    """
+    Start a container instance that all the predictions of this run share.
+    
+    Returns:
+        str: Name of the running instance (e.g. chai_1234 for chai.sif), or None if
+             it could not be started (the predictions then start the container
+             themselves)
+    """
+    name = f"{Path(image).stem}_{os.getpid()}"
+    output = subprocess.DEVNULL if quiet else None
+    try:
+        result = subprocess.run(["apptainer", "instance", "start", "--nv", image, name],
+                                stdout=output, stderr=output)
+    except OSError:
+        return None
+    return name if result.returncode == 0 else None
+
+def stop_instance(name):
+    """Stop a container instance started by start_instance."""
+    subprocess.run(["apptainer", "instance", "stop", name],
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def run_jobs(jobs, image, gpus=None, quiet=False):
+    """
+    Run (cmd, input_file, result_dir, cache_entry, log_file) jobs concurrently, one per GPU.
+    
+    The commands start with run_command(image). Each worker checks a GPU id out of a
+    queue for the duration of its job, so no two predictions share a GPU. The jobs
+    run in one container instance, which is started once and stopped when all jobs
+    are done, instead of starting the container for every prediction. The
+    environment (and so CUDA_VISIBLE_DEVICES) of each job is passed into the instance.
+    """
+    if not jobs:
+        return
+    
+    gpus = gpus or detect_gpus()
+    gpu_queue = queue.Queue()
+    for gpu_id in gpus:
+        gpu_queue.put(gpu_id)
+    
+    instance = start_instance(image, quiet)
+    if instance is not None:
+        runner = ["apptainer", "run", f"instance://{instance}"]
+        prefix_len = len(run_command(image))
+        jobs = [(runner + cmd[prefix_len:],) + tuple(rest) for cmd, *rest in jobs]
+    
+    try:
+        # Twice as many threads as GPUs, so a finished prediction's output can be
+        # cached while the next prediction already runs on its GPU
+        with ThreadPoolExecutor(max_workers=2 * len(gpus)) as executor:
+            futures = [executor.submit(run_prediction, *job, gpu_queue, quiet) for job in jobs]
+            for future in futures:
+                future.result()
+    finally:
+        if instance is not None:
+            stop_instance(instance)
@@ -8,16 +8,21 @@ This script:
 3. Creates fresh empty directories for a new run
 
 Usage:
-    python archive_and_clean.py [--no-archive] [--delete-outputs]
+    python archive_and_clean.py [--no-archive] [--delete-outputs] [--workers N]
 
 Options:
     --no-archive       Skip archiving previous outputs (keep existing files)
     --delete-outputs   Delete previous outputs without archiving
+    --workers N        Number of threads copying files across filesystems and deleting
+                       files (default: 8)
 """
 
 import os
+import sys
+import errno
 import shutil
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -28,6 +33,8 @@ def parse_arguments():
                         help='Skip archiving previous outputs (keep existing files)')
     parser.add_argument('--delete-outputs', action='store_true',
                         help='Delete previous outputs without archiving')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Number of threads copying files across filesystems and deleting files (default: 8)')
     return parser.parse_args()
 
 def create_archive_directory():
@@ -48,61 +55,197 @@ def is_dir_empty(dir_path):
     
     A directory is considered empty if:
     1. It has no files or subdirectories, or
-    2. It only contains empty files and empty subdirectories
+    2. It only contains empty files and empty subdirectories (and no symlinks)
     """
-    if not any(dir_path.iterdir()):
-        # Directory has no files or subdirectories
-        return True
-    
-    # Check each item in the directory
-    for item in dir_path.iterdir():
-        if item.is_file():
-            if not is_file_empty(item):
-                # Found a non-empty file
-                return False
-        elif item.is_dir():
-            if not is_dir_empty(item):
-                # Found a non-empty subdirectory
+    # Check each item in the directory (a single scandir, whose entries already know
+    # their type); a directory without any items is empty
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            if entry.is_symlink():
+                # A symlink is kept as an item of its own (never followed, so a link to
+                # a parent directory cannot loop)
                 return False
+            elif entry.is_file(follow_symlinks=False):
+                if entry.stat().st_size != 0:
+                    # Found a non-empty file
+                    return False
+            elif entry.is_dir(follow_symlinks=False):
+                if not is_dir_empty(entry.path):
+                    # Found a non-empty subdirectory
+                    return False
     
     # All files and subdirectories are empty
     return True
 
-def archive_directories(archive_dir, dirs_to_archive):
-    """Move non-empty directories to the archive directory."""
-    for dir_path in dirs_to_archive:
-        dir_path = Path(dir_path)
-        if dir_path.exists():
-            # Skip empty directories
-            if is_dir_empty(dir_path):
-                print(f"Skipped (empty): {dir_path}")
-                continue
+def check_dir_empty(dir_path):
+    """Check if a directory is empty (see is_dir_empty), or return None if it does not exist."""
+    try:
+        return is_dir_empty(dir_path)
+    except FileNotFoundError:
+        return None
+
+def copy_file_fast(src, dest):
+    """
+    Copy a file's contents and metadata.
+    
+    Uses os.copy_file_range so the data is copied inside the kernel, and falls
+    back to shutil.copy2 where that is unavailable or unsupported.
+    """
+    try:
+        with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        shutil.copystat(src, dest)
+    except (AttributeError, OSError):
+        # os.copy_file_range is missing (non-Linux) or not supported for these files
+        shutil.copy2(src, dest)
+
+def copy_tree_parallel(src, dest, max_workers=8):
+    """Copy a directory tree, copying the files concurrently on a thread pool."""
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = []
+        for root, dirs, files in os.walk(src):
+            target_root = os.path.normpath(os.path.join(dest, os.path.relpath(root, src)))
+            os.makedirs(target_root, exist_ok=True)
             
-            # Create the destination directory in the archive
-            dest_dir = archive_dir / dir_path
-            dest_dir.parent.mkdir(parents=True, exist_ok=True)
+            # Preserve symlinks rather than copying what they point to (os.walk lists
+            # symlinks to directories as directories but does not enter them)
+            for name in dirs:
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    os.symlink(os.readlink(path), os.path.join(target_root, name))
             
+            for name in files:
+                path = os.path.join(root, name)
+                target = os.path.join(target_root, name)
+                if os.path.islink(path):
+                    os.symlink(os.readlink(path), target)
+                else:
+                    futures.append(pool.submit(copy_file_fast, path, target))
+        
+        # Re-raise the first copy error, if any
+        for future in futures:
+            future.result()
+
+def submit_tree_removal(pool, path):
+    """
+    Submit the unlink calls for a directory tree to a thread pool.
+    
+    Returns:
+        tuple: (unlink futures, directories to remove bottom-up once they are done)
+    """
+    if os.path.islink(path) or not os.path.isdir(path):
+        # Remove a symlinked directory itself, never what it points to; os.walk
+        # yields nothing for a file (or a missing path), so unlink those directly too
+        return [pool.submit(os.unlink, path)], []
+    
+    dirs = []
+    futures = []
+    for root, subdirs, files in os.walk(path):
+        dirs.append(root)
+        # os.walk lists symlinks to directories as directories but does not enter them
+        links = [name for name in subdirs if os.path.islink(os.path.join(root, name))]
+        for name in files + links:
+            futures.append(pool.submit(os.unlink, os.path.join(root, name)))
+    return futures, dirs
+
+def finish_tree_removal(futures, dirs):
+    """Wait for the unlink calls of a tree and remove its emptied directories bottom-up."""
+    # Re-raise the first unlink error, if any
+    for future in futures:
+        future.result()
+    
+    for dir_path in reversed(dirs):
+        os.rmdir(dir_path)
+
+def remove_tree_parallel(path, max_workers=8):
+    """
+    Delete a directory tree, unlinking the files concurrently on a thread pool.
+    
+    The unlink calls release the GIL, so on fast or networked storage several of
+    them are in flight at once. The emptied directories are then removed bottom-up.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures, dirs = submit_tree_removal(pool, path)
+        finish_tree_removal(futures, dirs)
+
+def move_to_archive(src, dest, archive_dev, max_workers=8):
+    """
+    Move a file or directory into the archive.
+    
+    When the source is on the same filesystem as the archive directory, the
+    whole tree is moved with a single os.rename. Otherwise (or if the rename
+    fails with EXDEV) the data is copied and the source removed.
+    """
+    if os.stat(src).st_dev == archive_dev:
+        try:
+            os.rename(src, dest)
+            return
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+    
+    if os.path.isdir(src) and not os.path.islink(src):
+        copy_tree_parallel(src, dest, max_workers)
+        remove_tree_parallel(src, max_workers)
+    else:
+        shutil.move(src, dest)
+
+def archive_directories(archive_dir, dirs_to_archive, max_workers=8):
+    """Move non-empty directories to the archive directory."""
+    archive_dev = os.stat(archive_dir).st_dev
+    
+    # Create each distinct destination parent in the archive once
+    for parent in {os.path.dirname(os.path.join(archive_dir, d)) for d in dirs_to_archive}:
+        os.makedirs(parent, exist_ok=True)
+    
+    # Check the directories for content concurrently (each check can walk a deep tree);
+    # the moves below still happen one at a time
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(dirs_to_archive)))) as pool:
+        empty_dirs = list(pool.map(check_dir_empty, dirs_to_archive))
+    
+    for dir_path, is_empty in zip(dirs_to_archive, empty_dirs):
+        dir_path = Path(dir_path)
+        dest_dir = archive_dir / dir_path
+        if is_empty is None:
+            print(f"Skipped (not found): {dir_path}")
+            continue
+        
+        # Skip empty directories
+        if is_empty:
+            print(f"Skipped (empty): {dir_path}")
+            continue
+        
+        try:
             # Move the directory to the archive
-            shutil.move(str(dir_path), str(dest_dir))
-            print(f"Archived: {dir_path} -> {dest_dir}")
-        else:
+            move_to_archive(dir_path, dest_dir, archive_dev, max_workers)
+        except FileNotFoundError:
             print(f"Skipped (not found): {dir_path}")
+            continue
+        print(f"Archived: {dir_path} -> {dest_dir}")
 
 def archive_files(archive_dir, files_to_archive):
     """Move non-empty files to the archive directory."""
+    archive_dev = os.stat(archive_dir).st_dev
+    
     for file_path in files_to_archive:
         file_path = Path(file_path)
-        if file_path.exists():
+        try:
             # Skip empty files
             if is_file_empty(file_path):
                 print(f"Skipped (empty): {file_path}")
                 continue
             
             # Move the file to the archive
-            shutil.move(str(file_path), str(archive_dir / file_path.name))
-            print(f"Archived: {file_path} -> {archive_dir / file_path.name}")
-        else:
+            move_to_archive(file_path, archive_dir / file_path.name, archive_dev)
+        except FileNotFoundError:
             print(f"Skipped (not found): {file_path}")
+            continue
+        print(f"Archived: {file_path} -> {archive_dir / file_path.name}")
 
 def copy_config_files(archive_dir, config_files_to_copy):
     """Copy configuration files to the archive directory."""
@@ -115,46 +258,77 @@ def copy_config_files(archive_dir, config_files_to_copy):
                 continue
             
             # Copy the file to the archive
-            shutil.copy2(str(file_path), str(archive_dir / file_path.name))
+            shutil.copy2(file_path, archive_dir / file_path.name)
             print(f"Copied config: {file_path} -> {archive_dir / file_path.name}")
         else:
             print(f"Skipped (not found): {file_path}")
 
-def delete_directories(dirs_to_delete):
-    """Delete directories without archiving."""
-    for dir_path in dirs_to_delete:
-        dir_path = Path(dir_path)
-        if dir_path.exists():
-            shutil.rmtree(dir_path)
+def delete_directories(dirs_to_delete, max_workers=8):
+    """
+    Delete directories without archiving.
+    
+    The files of all directories are unlinked on one shared thread pool, so a large
+    tree (e.g. OUTPUT/CHAI) does not hold up the others; the results are still
+    reported in order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Queue the unlink calls of every tree before waiting for any of them
+        removals = []
+        for dir_path in dirs_to_delete:
+            dir_path = Path(dir_path)
+            if os.path.lexists(dir_path):
+                removals.append((dir_path, submit_tree_removal(pool, dir_path)))
+            else:
+                removals.append((dir_path, None))
+        
+        for dir_path, removal in removals:
+            if removal is None:
+                print(f"Skipped (not found): {dir_path}")
+                continue
+            finish_tree_removal(*removal)
             print(f"Deleted: {dir_path}")
-        else:
-            print(f"Skipped (not found): {dir_path}")
 
 def delete_files(files_to_delete):
     """Delete files without archiving."""
     for file_path in files_to_delete:
         file_path = Path(file_path)
-        if file_path.exists():
+        try:
             file_path.unlink()
-            print(f"Deleted: {file_path}")
-        else:
+        except FileNotFoundError:
             print(f"Skipped (not found): {file_path}")
+            continue
+        print(f"Deleted: {file_path}")
+
+def existing_dirs(parent):
+    """Get the names of the directories in a directory (following symlinks, like makedirs)."""
+    with os.scandir(parent) as it:
+        return {entry.name for entry in it if entry.is_dir()}
 
 def create_project_directories():
     """Create all necessary project directories."""
     dirs = ["CHAI_FASTA", "BOLTZ_YAML", "OUTPUT", "PSE_FILES", "plots", "csv"]
+    
+    # List the existing directories with one scandir and only create the missing ones
+    existing = existing_dirs(".")
     for dir_path in dirs:
-        Path(dir_path).mkdir(parents=True, exist_ok=True)
+        if dir_path not in existing:
+            os.makedirs(dir_path, exist_ok=True)
         print(f"Created directory: {dir_path}")
     
-    # Create subdirectories that are commonly needed
-    Path("OUTPUT/CHAI").mkdir(parents=True, exist_ok=True)
-    Path("OUTPUT/BOLTZ").mkdir(parents=True, exist_ok=True)
+    # Create subdirectories that are commonly needed (their parents exist now)
+    existing = existing_dirs("OUTPUT")
+    for name in ["CHAI", "BOLTZ"]:
+        if name not in existing:
+            os.makedirs(os.path.join("OUTPUT", name), exist_ok=True)
 
 def main():
     """Main function."""
     args = parse_arguments()
     
+    # Block-buffer stdout so the per-directory/per-file progress lines are written
+    # in batches rather than one write per line on a terminal
+    sys.stdout.reconfigure(line_buffering=False)
+    
     # Define directories and files to archive/delete
     dirs_to_handle = [
         "CHAI_FASTA",
@@ -162,7 +336,8 @@ def main():
         "OUTPUT",
         "PSE_FILES",
         "plots",
-        "csv"
+        "csv",
+        "logs"
     ]
     
     files_to_handle = [
@@ -181,7 +356,7 @@ def main():
     if args.delete_outputs:
         # Delete without archiving
         print("Deleting previous outputs without archiving...")
-        delete_directories(dirs_to_handle)
+        delete_directories(dirs_to_handle, args.workers)
         delete_files(files_to_handle)
     elif not args.no_archive:
         # Create archive directory
@@ -189,7 +364,7 @@ def main():
         
         # Archive directories and files
         print("Archiving previous outputs...")
-        archive_directories(archive_dir, dirs_to_handle)
+        archive_directories(archive_dir, dirs_to_handle, args.workers)
         archive_files(archive_dir, files_to_handle)
         
         # Copy configuration files
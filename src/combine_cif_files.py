@@ -10,7 +10,7 @@ Usage:
     python combine_cif_files.py [--template TEMPLATE_FILE]
                                [--chai-output CHAI_DIR] [--boltz-output BOLTZ_DIR]
                                [--pse-files PSE_DIR] [--molecules MOLECULES]
-                               [--quiet]
+                               [--workers N] [--quiet]
 
 Options:
     --template FILE      Template file (default: from config)
@@ -18,11 +18,15 @@ Options:
     --boltz-output DIR   BOLTZ output directory (default: from config)
     --pse-files DIR      Output directory for .pse files (default: from config)
     --molecules LIST     Comma-separated list of molecules to process (default: all)
+    --workers N          Number of worker processes for creating PSE files (default: number of CPUs)
     --quiet              Suppress detailed output
 """
 
 import os
+import sys
 import argparse
+import functools
+import multiprocessing
 import pymol
 from pymol import cmd
 from pathlib import Path
@@ -39,8 +43,23 @@ def parse_arguments():
     # Add molecules parameter
     parser.add_argument('--molecules', type=str, help='Comma-separated list of molecules to process')
     
+    # Add parallelism parameter
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes for creating PSE files (default: number of CPUs)')
+    
     return parser.parse_args()
 
+def list_subdirs(path, prefix=""):
+    """
+    List the subdirectories of a directory as os.DirEntry objects.
+    
+    The entries cache their file type, so is_dir() only needs a stat for symlinks
+    (which are followed, so symlinked prediction directories are still found), and
+    names not starting with prefix are skipped before their type is looked at.
+    """
+    with os.scandir(path) as it:
+        return [e for e in it if e.name.startswith(prefix) and e.is_dir()]
+
 def find_unique_names(chai_dir, boltz_dir, config, quiet=False):
     """Find all unique directory names that exist in both CHAI and BOLTZ outputs."""
     # Get default method values if not present in config
@@ -52,23 +71,20 @@ def find_unique_names(chai_dir, boltz_dir, config, quiet=False):
     
     # Get all directory names in CHAI
     chai_dirs = set()
-    if use_chai and chai_dir.exists():
+    if use_chai and os.path.isdir(chai_dir):
         # Process all directories (both regular and MSA)
-        for d in chai_dir.iterdir():
-            if d.is_dir():
-                # Include all subdirectories
-                chai_dirs.update(subdir.name for subdir in d.iterdir() if subdir.is_dir())
+        for d in list_subdirs(chai_dir):
+            # Include all subdirectories
+            chai_dirs.update(s.name for s in list_subdirs(d.path))
     
     # Get all directory names in BOLTZ
     boltz_dirs = set()
-    if use_boltz and boltz_dir.exists():
+    if use_boltz and os.path.isdir(boltz_dir):
         # Process all directories (both regular and MSA)
-        for d in boltz_dir.iterdir():
-            if d.is_dir():
-                # Extract base names from boltz_results_ prefix
-                boltz_dirs.update(subdir.name.replace('boltz_results_', '') 
-                                for subdir in d.iterdir() 
-                                if subdir.is_dir() and subdir.name.startswith('boltz_results_'))
+        for d in list_subdirs(boltz_dir):
+            # Extract base names from boltz_results_ prefix
+            boltz_dirs.update(s.name[len('boltz_results_'):]
+                              for s in list_subdirs(d.path, prefix='boltz_results_'))
     
     # Find common names if both CHAI and BOLTZ are used
     if use_chai and use_boltz:
@@ -85,11 +101,21 @@ def find_unique_names(chai_dir, boltz_dir, config, quiet=False):
     
     return unique_names
 
+def find_msa_dirs(base_dir):
+    """Find the *_with_MSA subdirectories of an output directory (empty list if it does not exist)."""
+    try:
+        with os.scandir(base_dir) as it:
+            # Match on the plain entry name and only build Path objects for the hits
+            return [Path(d.path) for d in it if d.name.endswith('_with_MSA') and d.is_dir()]
+    except FileNotFoundError:
+        return []
+
+# Characters that might cause issues in PyMOL object names, all mapped to '_'
+SANITIZE_TABLE = str.maketrans({'[': '_', ']': '_', '(': '_', ')': '_'})
+
 def sanitize_name(name):
     """Sanitize a name for use in PyMOL by replacing problematic characters."""
-    # Replace characters that might cause issues in PyMOL
-    sanitized = name.replace('[', '_').replace(']', '_').replace('(', '_').replace(')', '_')
-    return sanitized
+    return name.translate(SANITIZE_TABLE)
 
 def find_best_chai_model_idx(search_dir, quiet=False):
     """
@@ -104,14 +130,15 @@ def find_best_chai_model_idx(search_dir, quiet=False):
     """
     outs_json_path = search_dir / "outs.json"
     
-    if not outs_json_path.exists():
-        if not quiet:
-            print(f"Warning: outs.json not found in {search_dir}")
-        return 0  # Default to model 0 if outs.json not found
-    
     try:
-        with open(outs_json_path, 'r') as f:
-            data = json.load(f)
+        # Open the file directly rather than checking for it first (one syscall fewer)
+        try:
+            with open(outs_json_path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            if not quiet:
+                print(f"Warning: outs.json not found in {search_dir}")
+            return 0  # Default to model 0 if outs.json not found
         
         # Initialize variables to track best model
         best_idx = 0
@@ -143,6 +170,76 @@ def find_best_chai_model_idx(search_dir, quiet=False):
             print(f"Error reading outs.json in {search_dir}: {e}")
         return 0  # Default to model 0 if there's an error
 
+@functools.lru_cache(maxsize=None)
+def find_best_chai_cif(search_dir, quiet=False):
+    """
+    Find the CIF file of the best CHAI model in a directory, once per process.
+    
+    Every template looks up the same names, so the outs.json parse and the
+    existence check are cached like the BOLTZ predictions index.
+    
+    Returns:
+        Path or None: The pred.model_idx_N.cif file of the best model, if it exists
+    """
+    # Find the best model index based on complex-plddt
+    best_idx = find_best_chai_model_idx(search_dir, quiet)
+    
+    # Look for the CIF file with the best model_idx
+    cif_file = search_dir / f"pred.model_idx_{best_idx}.cif"
+    return cif_file if os.path.isfile(cif_file) else None
+
+@functools.lru_cache(maxsize=None)
+def index_boltz_predictions(predictions_dir):
+    """
+    Index a BOLTZ predictions directory with a single scan.
+    
+    Args:
+        predictions_dir (str): Path to a boltz_results_*/predictions directory
+        
+    Returns:
+        dict: Maps each prediction subdirectory name to its existing model_0 CIF file
+              (empty if the directory does not exist)
+    """
+    index = {}
+    try:
+        with os.scandir(predictions_dir) as it:
+            for entry in it:
+                if entry.is_dir():
+                    cif_file = os.path.join(entry.path, f"{entry.name}_model_0.cif")
+                    if os.path.isfile(cif_file):
+                        index[entry.name] = Path(cif_file)
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return index
+
+@functools.lru_cache(maxsize=None)
+def load_parent_prefixes(quiet=False):
+    """
+    Load the molecule_1 names from molecules.json once per process.
+    
+    Returns:
+        tuple: molecule_1 names in file order (empty if molecules.json can't be read)
+    """
+    try:
+        with open("molecules.json", 'r') as f:
+            data = json.load(f)
+            return tuple(mol[1] for mol in data["molecule_1"] if mol)  # Extract mol1_name
+    except Exception as e:
+        if not quiet:
+            print(f"Error loading molecules.json: {e}")
+        return ()
+
+@functools.lru_cache(maxsize=None)
+def find_parent_dir(name, prefixes):
+    """
+    Find the parent directory for a name: the first prefix that is the name itself
+    or followed by an underscore in it, or the full name if none matches.
+    """
+    for mol1_name in prefixes:
+        if name.startswith(mol1_name + "_") or name == mol1_name:
+            return mol1_name
+    return name
+
 def find_cif_file(base_dir, name, with_msa, quiet=False):
     """
     Find the CIF file in the specified directory.
@@ -164,22 +261,8 @@ def find_cif_file(base_dir, name, with_msa, quiet=False):
     Returns:
         Path or None: Path to the CIF file if found, None otherwise
     """
-    # Load molecules from molecules.json
-    try:
-        with open("molecules.json", 'r') as f:
-            data = json.load(f)
-            molecule_1 = [mol[1] for mol in data["molecule_1"] if mol]  # Extract mol1_name
-    except Exception as e:
-        if not quiet:
-            print(f"Error loading molecules.json: {e}")
-        molecule_1 = []
-    
-    # Find the parent directory by checking which molecule_1 is a prefix of the name
-    parent_dir = name  # Default to the full name
-    for mol1_name in molecule_1:
-        if name.startswith(mol1_name + "_") or name == mol1_name:
-            parent_dir = mol1_name
-            break
+    # Find the parent directory from the molecule_1 names in molecules.json
+    parent_dir = find_parent_dir(name, load_parent_prefixes(quiet))
     
     # Handle CHAI and BOLTZ differently
     if 'CHAI' in str(base_dir):
@@ -189,14 +272,8 @@ def find_cif_file(base_dir, name, with_msa, quiet=False):
         else:
             search_dir = base_dir / parent_dir / name
         
-        # Find the best model index based on complex-plddt
-        best_idx = find_best_chai_model_idx(search_dir, quiet)
-        
-        # Look for the CIF file with the best model_idx
-        cif_file = search_dir / f"pred.model_idx_{best_idx}.cif"
-        
-        # Check if file exists
-        if cif_file.exists():
+        cif_file = find_best_chai_cif(search_dir, quiet)
+        if cif_file:
             return cif_file
     else:
         if with_msa:
@@ -205,37 +282,220 @@ def find_cif_file(base_dir, name, with_msa, quiet=False):
             search_dir = base_dir / parent_dir / f"boltz_results_{name}"
         
         # For BOLTZ, check in predictions/[name]/[name]_model_0.cif
-        predictions_dir = search_dir / "predictions"
+        predictions = index_boltz_predictions(str(search_dir / "predictions"))
         
         # First try the expected path with name
-        name_dir = predictions_dir / name
-        if name_dir.exists() and name_dir.is_dir():
-            cif_file = name_dir / f"{name}_model_0.cif"
-            if cif_file.exists():
-                return cif_file
+        if name in predictions:
+            return predictions[name]
         
-        # If not found, check all subdirectories in predictions/
-        if predictions_dir.exists() and predictions_dir.is_dir():
-            # Check each subdirectory for the CIF file
-            for subdir in predictions_dir.iterdir():
-                if subdir.is_dir():
-                    # Try with subdirectory name
-                    cif_file = subdir / f"{subdir.name}_model_0.cif"
-                    if cif_file.exists():
-                        return cif_file
+        # If not found, fall back to the first subdirectory in predictions/ with a CIF file
+        if predictions:
+            return next(iter(predictions.values()))
     
     if not quiet:
         print(f"No CIF file found for {name}")
     return None
 
-def create_pse_files(unique_names, chai_dir, boltz_dir, template_file, output_dir, config, quiet=False):
-    """Create .pse files for each unique name."""
-    # Get reference name from template file
-    reference_name = template_file.name.split('.')[0]  # Remove file extension
+# Distinct colors for the loaded structures, assigned in load order
+STRUCTURE_COLORS = ('cyan', 'yellow', 'magenta', 'orange', 'pink', 'violet', 'salmon', 'lime', 'blue', 'red')
+
+# Structures aligned for each name, in load order:
+# (RMSD method name, label in messages, PyMOL object prefix, with MSA)
+STRUCTURE_SOURCES = (
+    ('chai', 'CHAI', 'chai', False),
+    ('chai_with_MSA', 'CHAI', 'chai_msa', True),
+    ('boltz', 'BOLTZ', 'boltz', False),
+    ('boltz_with_MSA', 'BOLTZ', 'boltz_msa', True),
+)
+
+# Template currently loaded in this process's PyMOL session (file, objects, template_obj)
+_loaded_template = {}
+
+def load_template(template_file, quiet=False):
+    """
+    Load a template file into the PyMOL session, reusing it across names.
+    
+    If the same template is already loaded, every other object and selection
+    is deleted and the template objects are kept, so the CIF is parsed once
+    per process rather than once per name.
+    
+    Returns:
+        tuple: (template_obj, template_objects), where template_obj is the largest
+               loaded object, or (None, []) if the file produced no objects
+    """
+    if _loaded_template.get("file") == template_file:
+        template_objects = _loaded_template["objects"]
+        for obj in cmd.get_names('all'):
+            if obj not in template_objects:
+                cmd.delete(obj)
+        cmd.reset()
+        return _loaded_template["template_obj"], template_objects
+    
+    # Clear the session (cheaper than cmd.reinitialize(), which also rebuilds settings)
+    _loaded_template.clear()
+    cmd.delete('all')
+    cmd.reset()
+    
+    # Load template - let PyMOL assign the default name
+    cmd.load(os.fspath(template_file))
+    if not quiet:
+        print(f"  Loaded template: {template_file}")
+    
+    # The session was empty, so every object now present came from the template
+    new_objects = cmd.get_names()
+    
+    if not new_objects:
+        return None, []
+    
+    # If there's only one object, use it as the template
+    if len(new_objects) == 1:
+        template_obj = new_objects[0]
+    else:
+        # Find the largest object by atom count
+        largest_obj = None
+        max_atoms = 0
+        for obj in new_objects:
+            atom_count = cmd.count_atoms(obj)
+            if not quiet:
+                print(f"    Object {obj} has {atom_count} atoms")
+            if atom_count > max_atoms:
+                max_atoms = atom_count
+                largest_obj = obj
+        
+        template_obj = largest_obj
+    
+    if not quiet:
+        print(f"  Using {template_obj} as template for alignment (largest protein)")
+    
+    _loaded_template.update(file=template_file, objects=new_objects, template_obj=template_obj)
+    return template_obj, new_objects
+
+def process_name(name, template_file, chai_dir, boltz_dir, output_dir, config, quiet=False):
+    """
+    Create the .pse file for a single name aligned to a template.
+    
+    This runs in its own worker process when names are processed in parallel,
+    so it only relies on its arguments and the process-local PyMOL session.
     
+    Returns:
+        list: RMSD values (one dict per aligned structure) for this name
+    """
     # List to store RMSD values
     rmsd_values = []
     
+    if not quiet:
+        print(f"Processing {name}...")
+    
+    if not template_file.exists():
+        print(f"  Warning: Template file {template_file} not found")
+        return rmsd_values
+    
+    # Load the template (or reuse it if this process already has it loaded)
+    template_obj, new_objects = load_template(template_file, quiet)
+    
+    if not template_obj:
+        print(f"  Warning: No objects loaded from template file")
+        return rmsd_values
+    
+    # Find and load CIF files
+    structures_loaded = 0
+    
+    # Sanitize the name for PyMOL
+    sanitized_name = sanitize_name(name)
+    
+    # Structures loaded so far, each colored with a different color as it is loaded
+    loaded_structures = []
+    
+    # Outlier-rejection cycles for the alignment (PyMOL's default is 5); setting
+    # alignment.cycles to 0 skips refinement and reports RMSD over all aligned atoms
+    align_cycles = config.get("alignment", {}).get("cycles", 5)
+    align = cmd.align
+    
+    # Output directory of each enabled method (read from the config once)
+    source_dirs = {"CHAI": chai_dir if config["methods"]["use_chai"] else None,
+                   "BOLTZ": boltz_dir if config["methods"]["use_boltz"] else None}
+    
+    # Find the CIF files of all enabled sources before making any PyMOL calls.
+    # MSA files are always tried, regardless of the use_msa flag
+    cif_files = [(method, label, prefix, with_msa, find_cif_file(source_dirs[label], name, with_msa, quiet))
+                 for method, label, prefix, with_msa in STRUCTURE_SOURCES if source_dirs[label] is not None]
+    
+    for method, label, prefix, with_msa, cif_file in cif_files:
+        if not cif_file:
+            if not quiet:
+                print(f"  Warning: {label} file for {name} ({'with' if with_msa else 'without'} MSA) not found")
+            continue
+        
+        structure_name = f'{prefix}_{sanitized_name}'
+        cmd.load(os.fspath(cif_file), structure_name)
+        loaded_structures.append(structure_name)
+        cmd.color(STRUCTURE_COLORS[(len(loaded_structures) - 1) % len(STRUCTURE_COLORS)], structure_name)
+        # Align to template protein
+        try:
+            alignment_result = align(structure_name, template_obj, cycles=align_cycles)
+            rmsd = alignment_result[0]  # First element is RMSD
+            rmsd_values.append({
+                'ligand': name,
+                'method': method,
+                'rmsd': rmsd
+            })
+            if not quiet:
+                print(f"  Loaded and aligned {label}{' (with MSA)' if with_msa else ''}: {cif_file}, RMSD: {rmsd:.4f}")
+            structures_loaded += 1
+        except pymol.CmdException as e:
+            print(f"  Error aligning {label}{' with MSA' if with_msa else ''}: {e}")
+    
+    # Set nice visualization
+    cmd.hide('everything')
+    cmd.show('cartoon')
+    
+    # Color all template objects the same color (cyan)
+    for obj in new_objects:
+        cmd.color('green', obj)
+    
+    if structures_loaded > 0:
+        cmd.center(template_obj)
+        cmd.zoom('all')
+        if not quiet:
+            print(f"  Colored template objects cyan and each structure with a unique color")
+    
+        # Save as PSE file if at least one structure was loaded
+        if structures_loaded > 0:
+            pse_file = output_dir / f"{name}.pse"
+            cmd.save(os.fspath(pse_file))
+            if not quiet:
+                print(f"  Created {pse_file}")
+        else:
+            print(f"  Skipping {name}.pse - No structures found")
+
+    return rmsd_values
+
+def run_pse_jobs(jobs, chai_dir, boltz_dir, output_dir, config, quiet=False, workers=None):
+    """
+    Run process_name for each (name, template_file) job.
+    
+    Jobs are spread across a pool of worker processes, each with its own PyMOL
+    session. With a single job or a single worker everything runs in-process.
+    
+    Returns:
+        list: The RMSD value list for each job, in job order
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+    
+    worker = functools.partial(process_name, chai_dir=chai_dir, boltz_dir=boltz_dir,
+                               output_dir=output_dir, config=config, quiet=quiet)
+    
+    if workers <= 1:
+        return [worker(name, template_file) for name, template_file in jobs]
+    
+    # Use fresh interpreters rather than forking a process that already holds PyMOL state
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        return pool.starmap(worker, jobs)
+
+def prepare_pse_output(output_dir, config, quiet=False):
+    """Prepare the configuration and output directory before creating .pse files."""
     # Ensure methods section exists in config
     if "methods" not in config:
         config["methods"] = {}
@@ -251,200 +511,7 @@ def create_pse_files(unique_names, chai_dir, boltz_dir, template_file, output_di
     if not quiet:
         print(f"Using output directory: {output_dir}")
     
-    for name in unique_names:
-        if not quiet:
-            print(f"Processing {name}...")
-        
-        # Reset PyMOL
-        cmd.reinitialize()
-        
-        # Load template - let PyMOL assign the default name
-        if template_file.exists():
-            # Get current objects before loading
-            objects_before = set(cmd.get_names())
-            
-            # Load template file
-            cmd.load(str(template_file))
-            if not quiet:
-                print(f"  Loaded template: {template_file}")
-            
-            # Get new objects after loading
-            objects_after = set(cmd.get_names())
-            
-            # Find the newly added object(s)
-            new_objects = list(objects_after - objects_before)
-            
-            if not new_objects:
-                print(f"  Warning: No objects loaded from template file")
-                continue
-            
-            # If there's only one object, use it as the template
-            if len(new_objects) == 1:
-                template_obj = new_objects[0]
-            else:
-                # Find the largest object by atom count
-                largest_obj = None
-                max_atoms = 0
-                for obj in new_objects:
-                    atom_count = cmd.count_atoms(obj)
-                    if not quiet:
-                        print(f"    Object {obj} has {atom_count} atoms")
-                    if atom_count > max_atoms:
-                        max_atoms = atom_count
-                        largest_obj = obj
-                
-                template_obj = largest_obj
-            
-            if not quiet:
-                print(f"  Using {template_obj} as template for alignment (largest protein)")
-            
-            # Keep the original name for the template object
-        else:
-            print(f"  Warning: Template file {template_file} not found")
-            continue
-        
-        # Find and load CIF files
-        structures_loaded = 0
-        
-        # Sanitize the name for PyMOL
-        sanitized_name = sanitize_name(name)
-        
-        # CHAI without MSA
-        if config["methods"]["use_chai"]:
-            chai_file = find_cif_file(chai_dir, name, False, quiet)
-            if chai_file:
-                structure_name = f'chai_{sanitized_name}'
-                cmd.load(str(chai_file), structure_name)
-                # Align to template protein
-                try:
-                    alignment_result = cmd.align(structure_name, template_obj)
-                    rmsd = alignment_result[0]  # First element is RMSD
-                    rmsd_values.append({
-                        'ligand': name,
-                        'method': 'chai',
-                        'rmsd': rmsd
-                    })
-                    if not quiet:
-                        print(f"  Loaded and aligned CHAI: {chai_file}, RMSD: {rmsd:.4f}")
-                    structures_loaded += 1
-                except pymol.CmdException as e:
-                    print(f"  Error aligning CHAI: {e}")
-            elif not quiet:
-                print(f"  Warning: CHAI file for {name} (without MSA) not found")
-        
-        # CHAI with MSA - Always try to load MSA files regardless of the use_msa flag
-        if config["methods"]["use_chai"]:
-            chai_msa_file = find_cif_file(chai_dir, name, True, quiet)
-            if chai_msa_file:
-                structure_name = f'chai_msa_{sanitized_name}'
-                cmd.load(str(chai_msa_file), structure_name)
-                # Align to template protein
-                try:
-                    alignment_result = cmd.align(structure_name, template_obj)
-                    rmsd = alignment_result[0]  # First element is RMSD
-                    rmsd_values.append({
-                        'ligand': name,
-                        'method': 'chai_with_MSA',
-                        'rmsd': rmsd
-                    })
-                    if not quiet:
-                        print(f"  Loaded and aligned CHAI (with MSA): {chai_msa_file}, RMSD: {rmsd:.4f}")
-                    structures_loaded += 1
-                except pymol.CmdException as e:
-                    print(f"  Error aligning CHAI with MSA: {e}")
-            elif not quiet:
-                print(f"  Warning: CHAI file for {name} (with MSA) not found")
-        
-        # BOLTZ without MSA
-        if config["methods"]["use_boltz"]:
-            boltz_file = find_cif_file(boltz_dir, name, False, quiet)
-            if boltz_file:
-                structure_name = f'boltz_{sanitized_name}'
-                cmd.load(str(boltz_file), structure_name)
-                # Align to template protein
-                try:
-                    alignment_result = cmd.align(structure_name, template_obj)
-                    rmsd = alignment_result[0]  # First element is RMSD
-                    rmsd_values.append({
-                        'ligand': name,
-                        'method': 'boltz',
-                        'rmsd': rmsd
-                    })
-                    if not quiet:
-                        print(f"  Loaded and aligned BOLTZ: {boltz_file}, RMSD: {rmsd:.4f}")
-                    structures_loaded += 1
-                except pymol.CmdException as e:
-                    print(f"  Error aligning BOLTZ: {e}")
-            elif not quiet:
-                print(f"  Warning: BOLTZ file for {name} (without MSA) not found")
-        
-        # BOLTZ with MSA - Always try to load MSA files regardless of the use_msa flag
-        if config["methods"]["use_boltz"]:
-            boltz_msa_file = find_cif_file(boltz_dir, name, True, quiet)
-            if boltz_msa_file:
-                structure_name = f'boltz_msa_{sanitized_name}'
-                cmd.load(str(boltz_msa_file), structure_name)
-                # Align to template protein
-                try:
-                    alignment_result = cmd.align(structure_name, template_obj)
-                    rmsd = alignment_result[0]  # First element is RMSD
-                    rmsd_values.append({
-                        'ligand': name,
-                        'method': 'boltz_with_MSA',
-                        'rmsd': rmsd
-                    })
-                    if not quiet:
-                        print(f"  Loaded and aligned BOLTZ (with MSA): {boltz_msa_file}, RMSD: {rmsd:.4f}")
-                    structures_loaded += 1
-                except pymol.CmdException as e:
-                    print(f"  Error aligning BOLTZ with MSA: {e}")
-            elif not quiet:
-                print(f"  Warning: BOLTZ file for {name} (with MSA) not found")
-        
-        # Set nice visualization
-        cmd.hide('everything')
-        cmd.show('cartoon')
-        
-        # Color all template objects the same color (cyan)
-        for obj in new_objects:
-            cmd.color('green', obj)
-        
-        # Define a list of distinct colors for the loaded structures
-        colors = ['cyan', 'yellow', 'magenta', 'orange', 'pink', 'violet', 'salmon', 'lime', 'blue', 'red']
-        color_index = 0
-        
-        # Color each loaded structure with a different color
-        loaded_structures = []
-        if config["methods"]["use_chai"] and 'chai_file' in locals() and chai_file:
-            loaded_structures.append(f'chai_{sanitized_name}')
-        if config["methods"]["use_chai"] and 'chai_msa_file' in locals() and chai_msa_file:
-            loaded_structures.append(f'chai_msa_{sanitized_name}')
-        if config["methods"]["use_boltz"] and 'boltz_file' in locals() and boltz_file:
-            loaded_structures.append(f'boltz_{sanitized_name}')
-        if config["methods"]["use_boltz"] and 'boltz_msa_file' in locals() and boltz_msa_file:
-            loaded_structures.append(f'boltz_msa_{sanitized_name}')
-        
-        for structure in loaded_structures:
-            cmd.color(colors[color_index % len(colors)], structure)
-            color_index += 1
-        
-        if structures_loaded > 0:
-            cmd.center(template_obj)
-            cmd.zoom('all')
-            if not quiet:
-                print(f"  Colored template objects cyan and each structure with a unique color")
-        
-            # Save as PSE file if at least one structure was loaded
-            if structures_loaded > 0:
-                pse_file = output_dir / f"{name}.pse"
-                cmd.save(str(pse_file))
-                if not quiet:
-                    print(f"  Created {pse_file}")
-            else:
-                print(f"  Skipping {name}.pse - No structures found")
-
-    # Return the RMSD values and reference name
-    return rmsd_values, reference_name, output_dir
+    return output_dir
 
 def get_molecule_specific_template(molecule_name, full_config, templates_dir):
     """Get the specific template for a molecule based on motif definitions."""
@@ -520,35 +587,15 @@ def get_templates(config, args, full_config=None):
     # If no templates found anywhere, return an empty list
     return []
 
-def process_template(template_file, unique_names, chai_dir, boltz_dir, output_dir, csv_dir, config, quiet=False):
-    """Process a single template file."""
-    if not template_file.exists():
-        print(f"Template file {template_file} does not exist.")
-        return False
-    
-    if not quiet:
-        print(f"\nProcessing template: {template_file}")
-    
-    # Create PSE files and get RMSD values, reference name, and template directory
-    rmsd_values, reference_name, template_dir = create_pse_files(
-        unique_names, chai_dir, boltz_dir, template_file, output_dir, config, quiet
-    )
-    
-    if not rmsd_values:
-        print(f"No RMSD values generated for template {template_file}.")
-        return False
-    
-    # No need to write RMSD values to CSV anymore
-    
-    if not quiet:
-        print(f"PSE files created successfully")
-    
-    return True
-
 def main():
     """Main function."""
     args = parse_arguments()
     
+    # Block-buffer stdout: the per-name template lines printed before the worker
+    # pool starts and the per-name results printed after it are each written in
+    # one batch (stdout is flushed before the pool and at the end)
+    sys.stdout.reconfigure(line_buffering=False)
+    
     # Load configuration
     full_config = config_loader.load_config()
     
@@ -563,8 +610,8 @@ def main():
     boltz_dir = Path(config.get("directories", {}).get("boltz_output", "OUTPUT/BOLTZ"))
     
     # Auto-detect MSA directories
-    chai_msa_dirs = [d for d in chai_dir.iterdir() if d.is_dir() and d.name.endswith('_with_MSA')] if chai_dir.exists() else []
-    boltz_msa_dirs = [d for d in boltz_dir.iterdir() if d.is_dir() and d.name.endswith('_with_MSA')] if boltz_dir.exists() else []
+    chai_msa_dirs = find_msa_dirs(chai_dir)
+    boltz_msa_dirs = find_msa_dirs(boltz_dir)
     
     # If MSA directories exist, set use_msa to True
     if chai_msa_dirs or boltz_msa_dirs:
@@ -598,7 +645,6 @@ def main():
             output_dir = Path(args.pse_files)
         else:
             output_dir = Path(config["directories"]["pse_files"])
-        csv_dir = Path(config["directories"]["csv"])
         templates_dir = Path(config["directories"].get("templates", "templates"))
     else:
         # New configuration structure
@@ -609,7 +655,6 @@ def main():
             output_dir = Path(args.pse_files)
         else:
             output_dir = Path(config.get("pse_files", "PSE_FILES"))
-        csv_dir = Path(config.get("csv", "csv"))
         templates_dir = Path(config.get("templates_dir", "templates"))
     
     # Find unique names
@@ -646,8 +691,8 @@ def main():
         if template_path.exists():
             template_file = template_path
     
-    # Process each unique name with its specific template
-    templates_processed = 0
+    # Pair each unique name with its specific template
+    jobs = []
     
     for name in unique_names:
         # Try to get a molecule-specific template
@@ -656,36 +701,40 @@ def main():
         if molecule_template and molecule_template.exists():
             if not args.quiet:
                 print(f"Using molecule-specific template for {name}: {molecule_template}")
-            
-            # Process this molecule with its specific template
-            rmsd_values, reference_name, _ = create_pse_files(
-                [name], chai_dir, boltz_dir, molecule_template, output_dir, config, args.quiet
-            )
-            
-            if rmsd_values:
-                # No need to write RMSD values to CSV anymore
-                
-                templates_processed += 1
-                if not args.quiet:
-                    print(f"PSE files created successfully")
-            else:
-                print(f"No RMSD values generated for {name} with template {molecule_template}.")
+            jobs.append((name, molecule_template))
         elif template_file:
             # If no molecule-specific template but a template was provided via command line, use that
             if not args.quiet:
                 print(f"Using command line template for {name}: {template_file}")
-            
-            if process_template(template_file, [name], chai_dir, boltz_dir, output_dir, csv_dir, config, args.quiet):
-                templates_processed += 1
+            jobs.append((name, template_file))
         else:
             # No template available for this molecule
             print(f"No template found for {name}. Skipping.")
     
+    # Process the names in parallel, each with its own template
+    templates_processed = 0
+    
+    if jobs:
+        # Keep names that share a template together so workers can reuse the loaded template
+        jobs.sort(key=lambda job: str(job[1]))
+        output_dir = prepare_pse_output(output_dir, config, args.quiet)
+        # Flush before the workers start writing so the output stays in order
+        sys.stdout.flush()
+        results = run_pse_jobs(jobs, chai_dir, boltz_dir, output_dir, config, args.quiet, args.workers)
+        
+        for (name, template), rmsd_values in zip(jobs, results):
+            if rmsd_values:
+                templates_processed += 1
+            else:
+                print(f"No RMSD values generated for {name} with template {template}.")
+    
     if templates_processed > 0:
         print(f"Successfully processed {templates_processed} templates.")
         print(f"All PSE files created successfully!")
     else:
         print("No templates were successfully processed.")
+    
+    sys.stdout.flush()
 
 if __name__ == "__main__":
     main()
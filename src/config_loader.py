@@ -118,15 +118,19 @@ def deep_merge(base, override):
     Values in override will overwrite values in base.
     For dictionaries, the merge is recursive.
     """
+    # Copy base once and merge into the copy (merging level by level with deep_merge
+    # would copy each nested dictionary again at every level)
     result = copy.deepcopy(base)
-    
+    merge_into(result, override)
+    return result
+
+def merge_into(result, override):
+    """Deep merge override into result in place (copying the values taken from override)."""
     for key, value in override.items():
         if key in result and isinstance(result[key], dict) and isinstance(value, dict):
-            result[key] = deep_merge(result[key], value)
+            merge_into(result[key], value)
         else:
             result[key] = copy.deepcopy(value)
-    
-    return result
 
 def get_merged_config(config, prediction_id=None):
     """
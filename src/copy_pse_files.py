@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Script to copy the base PyMOL session (.pse) files made by combine_cif_files.py from
+one directory to another.
+
+Motif analysis runs with the same CHAI/BOLTZ outputs, template, molecules and methods
+get identical base .pse files from combine_cif_files.py. run_pipeline.py therefore
+combines the CIF files for the first of them only, saves the base .pse files (as hard
+links, with --replace) and copies them into the directories of the later runs.
+
+Only the base sessions are copied: the *_motif.pse sessions that motif_alignment.py
+saves next to them, and any CSV files, are left out.
+
+Usage:
+    python copy_pse_files.py --source SOURCE_DIR --dest DEST_DIR [--link] [--replace]
+                             [--workers N] [--quiet]
+
+Options:
+    --source DIR   Directory holding the base .pse files
+    --dest DIR     Directory to copy them to (created if it does not exist)
+    --link         Hard-link the files instead of copying them (falls back to copying)
+    --replace      Remove the destination directory first
+    --workers N    Number of threads copying files (default: 8)
+    --quiet        Suppress detailed output
+"""
+
+import os
+import sys
+import shutil
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from archive_and_clean import copy_file_fast
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Copy the base PyMOL session files of a motif analysis run.')
+    parser.add_argument('--source', type=str, required=True,
+                        help='Directory holding the base .pse files')
+    parser.add_argument('--dest', type=str, required=True,
+                        help='Directory to copy them to (created if it does not exist)')
+    parser.add_argument('--link', action='store_true',
+                        help='Hard-link the files instead of copying them (falls back to copying)')
+    parser.add_argument('--replace', action='store_true',
+                        help='Remove the destination directory first')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Number of threads copying files (default: 8)')
+    parser.add_argument('--quiet', action='store_true',
+                        help='Suppress detailed output')
+    return parser.parse_args()
+
+def find_base_pse_files(pse_dir):
+    """Find the .pse files combine_cif_files.py wrote to a directory (skipping motif sessions)."""
+    with os.scandir(pse_dir) as entries:
+        return sorted(entry.path for entry in entries
+                      if entry.is_file() and entry.name.endswith(".pse") and not entry.name.endswith("_motif.pse"))
+
+def copy_file(src, dest, link=False):
+    """
+    Copy (or hard-link) a file, replacing the destination file.
+    
+    An existing destination is unlinked rather than overwritten, so a file it shares
+    its data with through a hard link is left alone. Files that cannot be linked (e.g.
+    across filesystems) are copied.
+    """
+    if os.path.lexists(dest):
+        os.unlink(dest)
+    
+    if link:
+        try:
+            os.link(src, dest)
+            return
+        except OSError:
+            pass
+    copy_file_fast(src, dest)
+
+def main():
+    """Main function."""
+    args = parse_arguments()
+    
+    source = Path(args.source)
+    dest = Path(args.dest)
+    if not source.is_dir():
+        print(f"Error: PSE files directory {source} does not exist")
+        sys.exit(1)
+    
+    if args.replace and dest.exists():
+        shutil.rmtree(dest)
+    dest.mkdir(exist_ok=True, parents=True)
+    
+    pse_files = find_base_pse_files(source)
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(copy_file, path, dest / os.path.basename(path), args.link) for path in pse_files]
+        
+        # Re-raise the first copy error, if any
+        for future in futures:
+            future.result()
+    
+    if not args.quiet:
+        print(f"{'Linked' if args.link else 'Copied'} {len(pse_files)} PSE files from {source} to {dest}")
+
+if __name__ == "__main__":
+    main()
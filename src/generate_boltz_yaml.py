@@ -3,6 +3,12 @@ import yaml
 import json
 import string
 
+# Use the libyaml-backed emitter when available
+try:
+    from yaml import CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeDumper as YamlDumper
+
 def load_molecules(json_file="molecules.json"):
     """Load molecule definitions from JSON file."""
     with open(json_file, 'r') as f:
@@ -56,9 +62,16 @@ def generate_yaml_files(output_base_dir="BOLTZ_YAML", use_msa=False):
             
             yaml_data = {"sequences": ENTITY_LIST}
             
-            # Write YAML file
-            with open(filename, "w") as f:
-                yaml.dump(yaml_data, f, default_flow_style=False, sort_keys=False)
+            # Write YAML file (small one-shot write, so skip the buffered file object)
+            payload = yaml.dump(yaml_data, Dumper=YamlDumper, default_flow_style=False, sort_keys=False)
+            fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                # os.write may write fewer bytes than asked for, so loop until all are written
+                data = memoryview(payload.encode())
+                while data:
+                    data = data[os.write(fd, data):]
+            finally:
+                os.close(fd)
 
 if __name__ == "__main__":
     import argparse
@@ -9,6 +9,7 @@ This script:
 4. Calculates RMSD values for the motif regions using the whole-protein alignment
 """
 
+import os
 import argparse
 import pymol
 from pymol import cmd
@@ -54,7 +55,7 @@ def process_pse_file(pse_file, motif_def, molecule, output_dir, quiet=False, mot
     cmd.reinitialize()
     
     # Load the PyMOL session
-    cmd.load(str(pse_file))
+    cmd.load(os.fspath(pse_file))
     
     if not quiet:
         print(f"Loaded PyMOL session: {pse_file}")
@@ -202,7 +203,7 @@ def process_pse_file(pse_file, motif_def, molecule, output_dir, quiet=False, mot
         
         # Save the aligned session - use a simpler filename without the motif ID
         motif_pse_file = motif_pse_dir / f"{pse_file.stem}_motif.pse"
-        cmd.save(str(motif_pse_file))
+        cmd.save(os.fspath(motif_pse_file))
         
         if not quiet:
             print(f"  Saved session with highlighted motif regions to {motif_pse_file}")
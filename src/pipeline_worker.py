@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Long-lived worker that runs pipeline scripts in a single Python interpreter.
+
+run_pipeline.py starts this worker once and sends it one JSON job per line on
+stdin, for example:
+
+    {"script": "src/plot_rmsd.py", "args": ["--quiet"], "quiet": true, "log_file": "logs/pipeline/rmsd-plot_x.log"}
+
+Each script runs as __main__ with the given arguments, exactly as if it had been
+started with `python src/plot_rmsd.py --quiet`, but the interpreter start-up and
+heavy imports (pandas, matplotlib, PyMOL) are only paid once per worker. In quiet
+mode the script's output goes to the log file (or, without one, only its error
+output is kept, in a temporary file). After each job the worker writes one JSON
+line with the exit code and, in quiet mode, the end of that output, e.g.
+{"returncode": 0, "stderr": ""}, and waits for the next job until stdin is closed.
+
+Usage:
+    python pipeline_worker.py CONSOLE_FD
+
+Arguments:
+    CONSOLE_FD  File descriptor the scripts' output is written to (stdout of the
+                worker is reserved for the job results)
+"""
+
+import os
+import sys
+import json
+import runpy
+import tempfile
+import traceback
+
+# How much of a quiet job's error output to send back
+ERROR_TAIL_BYTES = 4096
+
+def run_script(script, args, quiet=False, log_file=None):
+    """
+    Run a script as __main__ with the given command-line arguments.
+    
+    In quiet mode the output (including that of any subprocesses) goes to log_file;
+    without a log file it is discarded and the error output goes to a temporary
+    file. The end of that file is returned.
+    
+    Returns:
+        tuple: (exit code, tail of the logged output in quiet mode or "")
+    """
+    if quiet:
+        if log_file:
+            error_file = open(log_file, 'w+b')
+            output_fd = os.dup(error_file.fileno())
+        else:
+            error_file = tempfile.TemporaryFile()
+            output_fd = os.open(os.devnull, os.O_WRONLY)
+        saved_fds = [os.dup(1), os.dup(2)]
+        os.dup2(output_fd, 1)
+        os.dup2(error_file.fileno(), 2)
+        os.close(output_fd)
+    
+    returncode = 1
+    
+    # Scripts import their sibling modules (e.g. config_loader) directly
+    script_dir = os.path.dirname(os.path.abspath(script))
+    sys.path.insert(0, script_dir)
+    sys.argv = [script] + list(args)
+    line_buffering = sys.stdout.line_buffering
+    
+    try:
+        runpy.run_path(script, run_name="__main__")
+        returncode = 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            returncode = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+    except Exception:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        sys.stdout.reconfigure(line_buffering=line_buffering)
+        sys.path.remove(script_dir)
+        
+        # Start the next script with an empty PyMOL session
+        if "pymol" in sys.modules:
+            sys.modules["pymol"].cmd.reinitialize()
+    
+    error_output = ""
+    if quiet:
+        os.dup2(saved_fds[0], 1)
+        os.dup2(saved_fds[1], 2)
+        for fd in saved_fds:
+            os.close(fd)
+        
+        # Keep only the end of the output
+        size = error_file.seek(0, os.SEEK_END)
+        error_file.seek(max(0, size - ERROR_TAIL_BYTES))
+        error_output = error_file.read().decode(errors='replace')
+        error_file.close()
+    
+    return returncode, error_output
+
+def main():
+    """Main function."""
+    console_fd = int(sys.argv[1])
+    
+    # Keep the job results on a private copy of stdout and point the scripts'
+    # stdout at the console
+    results = os.fdopen(os.dup(1), 'w')
+    os.dup2(console_fd, 1)
+    os.close(console_fd)
+    sys.stdout.reconfigure(line_buffering=os.isatty(1))
+    
+    for line in sys.stdin:
+        job = json.loads(line)
+        returncode, error_output = run_script(job["script"], job.get("args", []), job.get("quiet", False),
+                                              job.get("log_file"))
+        results.write(json.dumps({"returncode": returncode, "stderr": error_output}) + "\n")
+        results.flush()
+
+if __name__ == "__main__":
+    main()
@@ -13,7 +13,8 @@ Usage:
 
 Options:
     --input INPUT_CSV    Input CSV file or directory (default: auto-detect)
-    --output OUTPUT_PNG  Output PNG file for the heatmap (default: plots/rmsd_heatmap_[reference].png)
+    --output OUTPUT_PNG  Output PNG file for the heatmap (default: plots/rmsd_heatmap_[reference].png);
+                         suffixed with _[reference] when whole protein data spans several references
     --reference REF      Reference name to filter by (default: use all references)
     --motif MOTIF_ID     Specific motif to plot (default: all motifs)
     --vmin VMIN          Minimum value for colormap (default: from config)
@@ -22,6 +23,7 @@ Options:
 """
 
 import argparse
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -29,6 +31,15 @@ from pathlib import Path
 import config_loader
 from matplotlib.colors import Normalize
 
+# Columns used from RMSD CSV files, with explicit dtypes so pandas skips type inference
+RMSD_CSV_DTYPES = {
+    'ligand': 'category',
+    'method': 'category',
+    'rmsd': 'float64',
+    'motif': 'category',
+    'reference': 'category'
+}
+
 def parse_arguments():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(description='Generate heatmaps of RMSD values.')
@@ -156,7 +167,8 @@ def read_rmsd_values(csv_files, quiet=False):
     
     for csv_file in csv_files:
         try:
-            df = pd.read_csv(csv_file)
+            df = pd.read_csv(csv_file, engine='c', usecols=lambda col: col in RMSD_CSV_DTYPES,
+                             dtype=RMSD_CSV_DTYPES)
             if not quiet:
                 print(f"Read {len(df)} RMSD values from {csv_file}")
             all_data.append(df)
@@ -171,7 +183,7 @@ def read_rmsd_values(csv_files, quiet=False):
     combined_df = pd.concat(all_data, ignore_index=True)
     return combined_df
 
-def create_rmsd_heatmap(df, output_file, config, full_config=None, motif_id=None, vmin=None, vmax=None, quiet=False):
+def create_rmsd_heatmap(df, output_file, config, full_config=None, motif_id=None, vmin=None, vmax=None, quiet=False, fig=None):
     """Create a heatmap visualization of RMSD values.
     
     Args:
@@ -183,6 +195,8 @@ def create_rmsd_heatmap(df, output_file, config, full_config=None, motif_id=None
         vmin: Minimum value for colormap
         vmax: Maximum value for colormap
         quiet: Whether to suppress output
+        fig: Optional Figure to reuse; it is cleared before drawing and left
+            open for the caller. A new figure is created and closed otherwise.
         
     Returns:
         True if successful, False otherwise
@@ -217,18 +231,7 @@ def create_rmsd_heatmap(df, output_file, config, full_config=None, motif_id=None
         if motif_def:
             motif_desc = motif_def.get("description", motif_id)
     
-    # Check for duplicate entries
-    if df.duplicated(subset=['ligand', 'method']).any():
-        if not quiet:
-            print("Warning: Found duplicate entries. Aggregating by taking the mean of RMSD values.")
-        # Aggregate duplicate entries by taking the mean
-        df = df.groupby(['ligand', 'method'], as_index=False)['rmsd'].mean()
-    
-    # Pivot the data for the heatmap
-    pivot_df = df.pivot(index='ligand', columns='method', values='rmsd')
-    
     # Determine available methods based on configuration and data
-    available_methods = []
     all_methods = ['chai', 'chai_with_MSA', 'boltz', 'boltz_with_MSA']
     
     # Filter methods based on configuration
@@ -239,22 +242,43 @@ def create_rmsd_heatmap(df, output_file, config, full_config=None, motif_id=None
     # Always include MSA methods regardless of the use_msa flag
     
     # Filter methods based on available data
-    for method in all_methods:
-        if method in pivot_df.columns:
-            available_methods.append(method)
+    present_methods = set(df['method'].unique())
+    available_methods = [m for m in all_methods if m in present_methods]
     
     if not available_methods:
         print("No methods available for visualization.")
         return False
     
-    # Reindex with available methods
-    pivot_df = pivot_df.reindex(columns=available_methods)
+    # Build the ligand x method matrix directly in NumPy (ligands sorted alphabetically)
+    ligands = np.sort(np.asarray(df['ligand'].unique(), dtype=object))
+    row_idx = pd.Index(ligands).get_indexer(df['ligand'])
+    col_idx = pd.Index(available_methods).get_indexer(df['method'])
+    keep = col_idx >= 0
+    row_idx, col_idx = row_idx[keep], col_idx[keep]
     
-    # Sort the ligands (rows) alphabetically
-    pivot_df = pivot_df.sort_index()
+    sums = np.zeros((len(ligands), len(available_methods)))
+    counts = np.zeros((len(ligands), len(available_methods)))
+    np.add.at(sums, (row_idx, col_idx), df['rmsd'].to_numpy(dtype=float)[keep])
+    np.add.at(counts, (row_idx, col_idx), 1)
     
-    # Create the heatmap
-    plt.figure(figsize=(10, max(8, len(pivot_df) * 0.4)))
+    # Check for duplicate entries
+    if counts.max() > 1 and not quiet:
+        print("Warning: Found duplicate entries. Aggregating by taking the mean of RMSD values.")
+    
+    # Aggregate duplicate entries by taking the mean (cells without data become NaN)
+    with np.errstate(invalid='ignore'):
+        rmsd_matrix = sums / counts
+    
+    # Create the heatmap, reusing the caller's figure when one is given
+    figsize = (10, max(8, len(ligands) * 0.4))
+    owns_figure = fig is None
+    if owns_figure:
+        fig = plt.figure(figsize=figsize)
+    else:
+        # Clearing the figure also drops the previous heatmap's colorbar axes
+        fig.clf()
+        fig.set_size_inches(figsize)
+    ax = fig.add_subplot()
     
     # Get visualization parameters
     if vmin is None:
@@ -262,29 +286,34 @@ def create_rmsd_heatmap(df, output_file, config, full_config=None, motif_id=None
     if vmax is None:
         vmax = config.get("visualization", {}).get("rmsd_vmax", 6.2)
     
+    # Format all cell annotations in one vectorized pass (empty for cells without data)
+    annotations = np.where(np.isnan(rmsd_matrix), '', np.char.mod('%.4f', np.nan_to_num(rmsd_matrix)))
+    
     # Create the heatmap with seaborn
-    ax = sns.heatmap(pivot_df, annot=True, cmap='RdYlGn_r', fmt='.4f', 
-                 norm=Normalize(vmin=vmin, vmax=vmax),
-                 cbar_kws={'label': 'RMSD (Å)'})
+    sns.heatmap(rmsd_matrix, annot=annotations, cmap='RdYlGn_r', fmt='',
+                xticklabels=available_methods, yticklabels=list(ligands),
+                norm=Normalize(vmin=vmin, vmax=vmax),
+                cbar_kws={'label': 'RMSD (Å)'}, ax=ax)
     
     # Set labels and title
     if motif_id:
-        plt.title(f'Motif-Specific RMSD Values: {motif_desc}', fontsize=14)
+        ax.set_title(f'Motif-Specific RMSD Values: {motif_desc}', fontsize=14)
     else:
-        plt.title(f'RMSD Values by Method and Ligand (Reference: {reference_name})', fontsize=14)
+        ax.set_title(f'RMSD Values by Method and Ligand (Reference: {reference_name})', fontsize=14)
     
-    plt.xlabel('Method', fontsize=12)
-    plt.ylabel('Ligand', fontsize=12)
+    ax.set_xlabel('Method', fontsize=12)
+    ax.set_ylabel('Ligand', fontsize=12)
     
     # Rotate x-axis labels for better readability
-    plt.xticks(rotation=45, ha='right')
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
     
     # Adjust layout
-    plt.tight_layout()
+    fig.tight_layout()
     
     # Save the figure
-    plt.savefig(output_file, dpi=300, bbox_inches='tight')
-    plt.close()
+    fig.savefig(output_file, dpi=300, bbox_inches='tight')
+    if owns_figure:
+        plt.close(fig)
     
     if not quiet:
         print(f"Heatmap saved to {output_file}")
@@ -381,9 +410,17 @@ def main():
             print(f"No data found for reference '{args.reference}'")
             return
     
+    # Whole protein data read from several CSV files can cover several references;
+    # render one heatmap per reference from the single combined DataFrame
+    if not args.motif and 'reference' in df.columns and df['reference'].nunique() > 1:
+        heatmaps = list(df.groupby('reference', sort=False, observed=True))
+    else:
+        heatmaps = [(None, df)]
+    
     # Determine output file
     if args.output:
         output_file = Path(args.output)
+        plot_dir = output_file.parent
     else:
         # Get analysis run name
         analysis_run_name = None
@@ -415,14 +452,27 @@ def main():
                 reference_name = df['reference'].iloc[0]
             output_file = plot_dir / f'rmsd_heatmap_{reference_name}.png'
     
-    # Create heatmap
-    success = create_rmsd_heatmap(df, output_file, config, full_config, args.motif, args.vmin, args.vmax, args.quiet)
+    # Draw every heatmap into one reusable figure instead of allocating one per reference
+    fig = plt.figure()
     
-    if success:
-        if not args.quiet:
-            print(f"Heatmap created successfully: {output_file}")
-    else:
-        print(f"Failed to create heatmap")
+    for reference_name, reference_df in heatmaps:
+        if reference_name is None:
+            heatmap_file = output_file
+        elif args.output:
+            heatmap_file = output_file.with_name(f"{output_file.stem}_{reference_name}{output_file.suffix}")
+        else:
+            heatmap_file = plot_dir / f'rmsd_heatmap_{reference_name}.png'
+        
+        # Create heatmap
+        success = create_rmsd_heatmap(reference_df, heatmap_file, config, full_config, args.motif, args.vmin, args.vmax, args.quiet, fig)
+        
+        if success:
+            if not args.quiet:
+                print(f"Heatmap created successfully: {heatmap_file}")
+        else:
+            print(f"Failed to create heatmap")
+    
+    plt.close(fig)
 
 if __name__ == "__main__":
     main()
@@ -7,18 +7,30 @@ the Boltz prediction tool on it.
 
 Usage:
     python run_boltz_apptainer.py [--input INPUT_DIR] [--output OUTPUT_DIR] 
-                                 [--use-msa] [--quiet]
+                                 [--use-msa] [--gpus GPU_IDS] [--cache-dir CACHE_DIR]
+                                 [--no-cache] [--cache-max-bytes N] [--quiet]
 
 Options:
     --input INPUT_DIR     Input directory containing YAML files (default: BOLTZ_YAML)
     --output OUTPUT_DIR   Output directory for predictions (default: OUTPUT/BOLTZ)
     --use-msa             Use MSA server for predictions
+    --gpus GPU_IDS        Comma-separated GPU ids to run predictions on (default: auto-detect)
+    --cache-dir CACHE_DIR Directory for cached predictions keyed by input content (default: CACHE)
+    --no-cache            Do not reuse or store cached predictions
+    --cache-max-bytes N   Evict the least recently used cached predictions beyond N bytes (default: no limit)
     --quiet               Suppress detailed output
 """
 
-import subprocess
 import argparse
 from pathlib import Path
+from apptainer_jobs import (CONTAINER_IMAGES, run_command, compute_cache_key, restore_from_cache,
+                            evict_cache, scan_input_folders, find_finished_dirs, run_jobs)
+
+# Container image used for the predictions
+CONTAINER_IMAGE = CONTAINER_IMAGES["boltz"]
+
+# Command that starts the container for a single prediction
+RUN_COMMAND = run_command(CONTAINER_IMAGE)
 
 def parse_arguments():
     """Parse command line arguments."""
@@ -29,6 +41,14 @@ def parse_arguments():
                         help='Output directory for predictions (default: OUTPUT/BOLTZ)')
     parser.add_argument('--use-msa', action='store_true',
                         help='Use MSA server for predictions')
+    parser.add_argument('--gpus', type=str,
+                        help='Comma-separated GPU ids to run predictions on (default: auto-detect)')
+    parser.add_argument('--cache-dir', type=str, default='CACHE',
+                        help='Directory for cached predictions keyed by input content (default: CACHE)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not reuse or store cached predictions')
+    parser.add_argument('--cache-max-bytes', type=int,
+                        help='Evict the least recently used cached predictions beyond N bytes (default: no limit)')
     parser.add_argument('--quiet', action='store_true',
                         help='Suppress detailed output')
     return parser.parse_args()
@@ -39,53 +59,79 @@ def get_msa_config(use_msa):
         return ["--use_msa_server"], True
     return [], False
 
+def find_completed_results(output_dir):
+    """
+    Find the finished predictions in an output directory.
+    
+    Returns:
+        set: Names of the boltz_results_* directories that already contain both
+             predictions and processed
+    """
+    return find_finished_dirs(output_dir, {"predictions", "processed"}, prefix="boltz_results_")
+
 def run_apptainer_commands(input_dir='BOLTZ_YAML', output_dir='OUTPUT/BOLTZ', 
-                          use_msa=False, quiet=False):
-    """Run apptainer commands for each YAML file in input directory."""
+                          use_msa=False, quiet=False, gpus=None,
+                          cache_dir='CACHE', cache_max_bytes=None, log_dir='logs/BOLTZ'):
+    """
+    Run apptainer commands for each YAML file in input directory.
+    
+    The predictions are independent, so they run concurrently with one prediction
+    per GPU (gpus, or the detected GPUs when not given). Predictions whose input,
+    MSA options and container match an earlier successful run are restored from
+    cache_dir instead of being rerun (pass cache_dir=None to disable the cache). With
+    cache_max_bytes the least recently used cache entries are evicted afterwards.
+    In quiet mode the output of each prediction goes to log_dir/<folder>/<input>.log.
+    """
     msa_config, using_msa = get_msa_config(use_msa)
     
     # Create output directory
     output_base = Path(output_dir)
     output_base.mkdir(parents=True, exist_ok=True)
     
-    for folder in Path(input_dir).iterdir():
-        if folder.is_dir():
-            # Create subdirectory for each input folder with _with_MSA suffix if using MSA
-            folder_name = f"{folder.name}_with_MSA" if using_msa else folder.name
-            output_dir = output_base / folder_name
+    # Collect the commands first, then run them one per GPU
+    jobs = []
+    
+    for input_folder, input_files in scan_input_folders(input_dir, '.yaml'):
+        # Create subdirectory for each input folder with _with_MSA suffix if using MSA
+        folder_name = f"{input_folder}_with_MSA" if using_msa else input_folder
+        output_dir = output_base / folder_name
+        
+        output_dir.mkdir(exist_ok=True)
+        
+        # Scan the existing outputs once instead of checking each YAML file's outputs
+        completed = find_completed_results(output_dir)
+        
+        for yaml_file in input_files:
+            # Boltz names its results after the YAML file (the _with_MSA suffix is only
+            # on the folder)
+            base_name = yaml_file.stem  # Get filename without extension
             
-            output_dir.mkdir(exist_ok=True)
+            result_dir = output_dir / f"boltz_results_{base_name}"
+            cache_entry = None
+            if cache_dir:
+                cache_entry = Path(cache_dir) / "boltz" / compute_cache_key(yaml_file, msa_config, CONTAINER_IMAGE)
             
-            for yaml_file in folder.glob('*.yaml'):
-                # Get base name and add _with_MSA if using MSA
-                base_name = yaml_file.stem  # Get filename without extension
-                if using_msa:
-                    base_name = f"{base_name}_with_MSA"
-                
-                # Check for typical output directories with boltz_results_ prefix
-                expected_dirs = [
-                    output_dir / f"boltz_results_{base_name}" / "predictions",
-                    output_dir / f"boltz_results_{base_name}" / "processed"
-                ]
-                
-                if all(d.exists() for d in expected_dirs):
-                    print(f"Skipping {yaml_file.name} - output directories already exist")
-                    continue
-                
-                cmd = [
-                    "apptainer", "run", "--nv",
-                    "/emcc/westberg/shared/containers/boltz.sif",
-                    str(yaml_file),  # YAML file path as positional argument
-                    f"--out_dir=OUTPUT/BOLTZ/{folder_name}"
-                ] + msa_config
-                
-                if not quiet:
-                    print(f"Processing: {yaml_file}")
-                
-                subprocess.run(cmd, capture_output=quiet)
-                
-                if not quiet:
-                    print(f"Completed: {yaml_file}\n")
+            # Check for typical output directories with boltz_results_ prefix
+            if result_dir.name in completed:
+                print(f"Skipping {yaml_file.name} - output directories already exist")
+                continue
+            
+            # Reuse the output of an earlier run with identical inputs
+            if cache_entry is not None and restore_from_cache(cache_entry, result_dir):
+                print(f"Skipping {yaml_file.name} - restored from cache")
+                continue
+            
+            cmd = RUN_COMMAND + [
+                str(yaml_file),  # YAML file path as positional argument
+                f"--out_dir=OUTPUT/BOLTZ/{folder_name}"
+            ] + msa_config
+            
+            jobs.append((cmd, yaml_file, result_dir, cache_entry, Path(log_dir) / folder_name / f"{base_name}.log"))
+    
+    run_jobs(jobs, CONTAINER_IMAGE, gpus, quiet)
+    
+    if cache_dir and cache_max_bytes is not None:
+        evict_cache(Path(cache_dir) / "boltz", cache_max_bytes)
 
 def main():
     """Main function."""
@@ -94,7 +140,10 @@ def main():
         input_dir=args.input,
         output_dir=args.output,
         use_msa=args.use_msa,
-        quiet=args.quiet
+        quiet=args.quiet,
+        gpus=args.gpus.split(',') if args.gpus else None,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        cache_max_bytes=args.cache_max_bytes
     )
     print("All YAML files processed!")
 
@@ -7,19 +7,35 @@ the CHAI prediction tool on it.
 
 Usage:
     python run_chai_apptainer.py [--input INPUT_DIR] [--output OUTPUT_DIR] 
-                                [--use-msa] [--use-msa-dir] [--quiet]
+                                [--use-msa] [--use-msa-dir]
+                                [--gpus GPU_IDS] [--cache-dir CACHE_DIR]
+                                [--no-cache] [--cache-max-bytes N] [--quiet]
 
 Options:
     --input INPUT_DIR     Input directory containing FASTA files (default: CHAI_FASTA)
     --output OUTPUT_DIR   Output directory for predictions (default: OUTPUT/CHAI)
     --use-msa             Use MSA for predictions
     --use-msa-dir         Use MSA directory (CHAI_MSAs)
+    --gpus GPU_IDS        Comma-separated GPU ids to run predictions on (default: auto-detect)
+    --cache-dir CACHE_DIR Directory for cached predictions keyed by input content (default: CACHE)
+    --no-cache            Do not reuse or store cached predictions
+    --cache-max-bytes N   Evict the least recently used cached predictions beyond N bytes (default: no limit)
     --quiet               Suppress detailed output
 """
 
-import subprocess
 import argparse
 from pathlib import Path
+from apptainer_jobs import (CONTAINER_IMAGES, run_command, directory_digest, compute_cache_key,
+                            restore_from_cache, evict_cache, scan_input_folders, find_finished_dirs, run_jobs)
+
+# Container image used for the predictions
+CONTAINER_IMAGE = CONTAINER_IMAGES["chai"]
+
+# Command that starts the container for a single prediction
+RUN_COMMAND = run_command(CONTAINER_IMAGE)
+
+# Directory with precomputed MSAs (--use-msa-dir)
+MSA_DIRECTORY = "CHAI_MSAs"
 
 def parse_arguments():
     """Parse command line arguments."""
@@ -32,6 +48,14 @@ def parse_arguments():
                         help='Use MSA for predictions')
     parser.add_argument('--use-msa-dir', action='store_true',
                         help='Use MSA directory (CHAI_MSAs)')
+    parser.add_argument('--gpus', type=str,
+                        help='Comma-separated GPU ids to run predictions on (default: auto-detect)')
+    parser.add_argument('--cache-dir', type=str, default='CACHE',
+                        help='Directory for cached predictions keyed by input content (default: CACHE)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not reuse or store cached predictions')
+    parser.add_argument('--cache-max-bytes', type=int,
+                        help='Evict the least recently used cached predictions beyond N bytes (default: no limit)')
     parser.add_argument('--quiet', action='store_true',
                         help='Suppress detailed output')
     return parser.parse_args()
@@ -42,60 +66,95 @@ def get_msa_config(use_msa, use_msa_dir):
         return [], False
     
     if use_msa_dir:
-        return ["msa_directory=CHAI_MSAs", "msa_server=1"], True
+        return [f"msa_directory={MSA_DIRECTORY}", "msa_server=1"], True
     
     return ["msa_server=1"], True
 
+def find_completed_outputs(output_dir):
+    """
+    Find the finished predictions in an output directory.
+    
+    Returns:
+        set: Names of the subdirectories that already contain both outs.json and
+             pred.model_idx_0.cif
+    """
+    return find_finished_dirs(output_dir, {"outs.json", "pred.model_idx_0.cif"})
+
 def run_apptainer_commands(input_dir='CHAI_FASTA', output_dir='OUTPUT/CHAI', 
-                          use_msa=False, use_msa_dir=False, quiet=False):
-    """Run apptainer commands for each FASTA file in input directory."""
+                          use_msa=False, use_msa_dir=False, quiet=False, gpus=None,
+                          cache_dir='CACHE', cache_max_bytes=None, log_dir='logs/CHAI'):
+    """
+    Run apptainer commands for each FASTA file in input directory.
+    
+    The predictions are independent, so they run concurrently with one prediction
+    per GPU (gpus, or the detected GPUs when not given). Predictions whose input,
+    MSA options (including the contents of the MSA directory) and container match
+    an earlier successful run are restored from cache_dir instead of being rerun
+    (pass cache_dir=None to disable the cache). With cache_max_bytes the least
+    recently used cache entries are evicted afterwards.
+    In quiet mode the output of each prediction goes to log_dir/<folder>/<input>.log.
+    """
     msa_configs, using_msa = get_msa_config(use_msa, use_msa_dir)
     
     if not quiet:
         print(f"MSA config is: {msa_configs}")
     
+    # The predictions read the MSA directory, so its contents are part of the cache
+    # key (hashed once for all predictions)
+    cache_args = msa_configs
+    if cache_dir and f"msa_directory={MSA_DIRECTORY}" in msa_configs:
+        cache_args = msa_configs + [f"msa_directory_digest={directory_digest(MSA_DIRECTORY)}"]
+    
     # Create output directory
     output_base = Path(output_dir)
     output_base.mkdir(parents=True, exist_ok=True)
     
-    for folder in Path(input_dir).iterdir():
-        if folder.is_dir():
-            # Create subdirectory for each input folder with _with_MSA suffix if using MSA
-            folder_name = f"{folder.name}_with_MSA" if using_msa else folder.name
-            output_dir = output_base / folder_name
+    # Collect the commands first, then run them one per GPU
+    jobs = []
+    
+    for input_folder, input_files in scan_input_folders(input_dir, '.fasta'):
+        # Create subdirectory for each input folder with _with_MSA suffix if using MSA
+        folder_name = f"{input_folder}_with_MSA" if using_msa else input_folder
+        output_dir = output_base / folder_name
+        
+        output_dir.mkdir(exist_ok=True)
+        
+        # Scan the existing outputs once instead of checking each FASTA file's outputs
+        completed = find_completed_outputs(output_dir)
+        
+        for fasta in input_files:
+            # Check if output files already exist for this FASTA
+            base_name = fasta.stem  # Get filename without extension
+            
+            result_dir = output_dir / base_name
+            cache_entry = None
+            if cache_dir:
+                cache_entry = Path(cache_dir) / "chai" / compute_cache_key(fasta, cache_args, CONTAINER_IMAGE)
+            
+            # Check for typical output files
+            if base_name in completed:
+                print(f"Skipping {fasta.name} - output files already exist")
+                continue
             
-            output_dir.mkdir(exist_ok=True)
+            # Reuse the output of an earlier run with identical inputs
+            if cache_entry is not None and restore_from_cache(cache_entry, result_dir):
+                print(f"Skipping {fasta.name} - restored from cache")
+                continue
             
-            for fasta in folder.glob('*.fasta'):
-                # Check if output files already exist for this FASTA
-                base_name = fasta.stem  # Get filename without extension
-                output_files_exist = False
-                
-                # Check for typical output files
-                expected_files = [
-                    output_dir / base_name / "outs.json",
-                    output_dir / base_name / "pred.model_idx_0.cif"
-                ]
-                
-                if all(f.exists() for f in expected_files):
-                    print(f"Skipping {fasta.name} - output files already exist")
-                    continue
-                
-                cmd = [
-                    "apptainer", "run", "--nv",
-                    "/emcc/westberg/shared/containers/chai.sif",
-                    f"input_paths={fasta}",
-                    f"outdir=OUTPUT/CHAI/{folder_name}",
-                ] + msa_configs
+            cmd = RUN_COMMAND + [
+                f"input_paths={fasta}",
+                f"outdir=OUTPUT/CHAI/{folder_name}",
+            ] + msa_configs
 
-                if not quiet:
-                    print(f"Running subprocess terminal command:\n{cmd}")
-                    print(f"Processing: {fasta}")
-                
-                subprocess.run(cmd, capture_output=quiet)
-                
-                if not quiet:
-                    print(f"Completed: {fasta}\n")
+            if not quiet:
+                print(f"Running subprocess terminal command:\n{cmd}")
+            
+            jobs.append((cmd, fasta, result_dir, cache_entry, Path(log_dir) / folder_name / f"{base_name}.log"))
+    
+    run_jobs(jobs, CONTAINER_IMAGE, gpus, quiet)
+    
+    if cache_dir and cache_max_bytes is not None:
+        evict_cache(Path(cache_dir) / "chai", cache_max_bytes)
 
 def main():
     """Main function."""
@@ -105,7 +164,10 @@ def main():
         output_dir=args.output,
         use_msa=args.use_msa,
         use_msa_dir=args.use_msa_dir,
-        quiet=args.quiet
+        quiet=args.quiet,
+        gpus=args.gpus.split(',') if args.gpus else None,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        cache_max_bytes=args.cache_max_bytes
     )
     print("All FASTA files processed!")
 